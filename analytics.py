@@ -0,0 +1,280 @@
+import io
+import os
+import glob
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import fares
+import history
+
+EVENT_COLUMNS = ['query_datetime', 'leg', 'flight', 'fare', 'previousFare', 'change', 'direction']
+LOWEST_COLUMNS = ['query_datetime', 'leg', 'flight', 'fare']
+DAILY_COLUMNS = ['day', 'leg', 'min', 'median', 'max', 'count']
+DEPARTURE_COLUMNS = ['leg', 'daysToDeparture', 'min', 'max', 'sum', 'count']
+
+# Outputs which updates append to. Their sizes are saved in state.json with the rest of the state,
+# so rows appended by an update that was interrupted before saving it are truncated, not duplicated
+APPENDED = ['events.csv', 'lowest.csv', 'daily.csv']
+
+def emptyState():
+    return {'offset': 0, 'lastFares': {}, 'openDay': None, 'openDayFares': [], 'sizes': {}, 'departure': []}
+
+def readNewRows(fileName, offset):
+    """
+    Reads the complete rows appended to a history CSV after byte offset, returning (rows, offset)
+    where offset is where the next read should start
+    """
+    with open(fileName, 'rb') as historyFile:
+        historyFile.seek(offset)
+        data = historyFile.read()
+
+    # A scrape may be in the middle of appending, so only take complete lines
+    data = data[:data.rfind(b'\n') + 1]
+    if not data.strip():
+        return pd.DataFrame(columns = history.COLUMNS), offset + len(data)
+
+    rows = pd.read_csv(io.BytesIO(data), header = 0 if offset == 0 else None, names = history.COLUMNS,
+        dtype = {'flight': str, 'returnOrDepart': str, 'query_datetime': str})
+    return rows, offset + len(data)
+
+class tripAnalytics(object):
+    """
+    Fare aggregates for one trip, kept in their own directory and brought up to date from only the
+    rows appended to the trip's CSV history since the previous update:
+        events.csv - fare changes per flight (up/down with magnitude, sold out, available again),
+            which starting from each flight's first fare ('new') is also its fare time series
+        lowest.csv - lowest qualifying fare and flight per leg for every scrape
+        daily.csv - min/median/max qualifying fare per leg per day, for days that are over
+        departure.csv - lowest qualifying fare per leg by days to departure
+        state.json - read offset, last fare per flight, the current day's fares, the sizes of the
+            appended files and the departure curve (which departure.csv is a copy of)
+    An update only counts once state.json is written, so an interrupted one is redone in full
+    """
+
+    def __init__(self, historyFile, analyticsDir):
+        self.historyFile = historyFile
+        self.name = os.path.splitext(os.path.basename(historyFile))[0]
+        self.directory = os.path.join(analyticsDir, self.name)
+
+        configFile = os.path.join(os.path.dirname(historyFile), self.name + '_config.json')
+        self.config = {}
+        if os.path.exists(configFile):
+            with open(configFile) as configJson:
+                self.config = json.load(configJson)
+
+        self.state = emptyState()
+        if os.path.exists(self.fileName('state.json')):
+            with open(self.fileName('state.json')) as stateJson:
+                self.state = json.load(stateJson)
+            if 'sizes' not in self.state:
+                # Saved before sizes were, when the files were all there was
+                self.state['sizes'] = dict((name, os.path.getsize(self.fileName(name))) for name in APPENDED if os.path.exists(self.fileName(name)))
+                self.state['departure'] = self.read('departure.csv').astype(object).values.tolist()
+
+    def fileName(self, name):
+        return os.path.join(self.directory, name)
+
+    def rebuild(self):
+        shutil.rmtree(self.directory, ignore_errors = True)
+        self.state = emptyState()
+
+    def truncate(self):
+        # Drops whatever an interrupted update appended after the state was last saved
+        for name in APPENDED:
+            fileName = self.fileName(name)
+            if os.path.exists(fileName) and (os.path.getsize(fileName) > self.state['sizes'].get(name, 0)):
+                with open(fileName, 'rb+') as outputFile:
+                    outputFile.truncate(self.state['sizes'].get(name, 0))
+
+    def qualifying(self, rows):
+        """Vectorized version of fareTracker.qualifies, using the rules in the trip's _config.json"""
+        fare = rows['fare'].to_numpy()
+        specificFlights = fares.parseSpecificFlights(self.config.get('specificFlights', ''))
+        if specificFlights:
+            return ~np.isnan(fare) & rows['flight'].isin(specificFlights).to_numpy()
+
+        maxStops = self.config.get('maxStops', 8)
+        maxDuration = self.config.get('maxDuration') or np.inf
+        maxPrice = self.config.get('maxPrice') or np.inf
+        return ~np.isnan(fare) & (rows['stops'].to_numpy() <= maxStops) & \
+            (rows['duration'].to_numpy() <= maxDuration) & (fare <= maxPrice)
+
+    def appendCsv(self, name, frame, columns):
+        fileName = self.fileName(name)
+        frame[columns].to_csv(fileName, mode = 'a', header = self.state['sizes'].get(name, 0) == 0, index = False)
+
+    def update(self):
+        """Processes rows appended since the last update, returning how many there were"""
+        if os.path.exists(self.historyFile) and (os.path.getsize(self.historyFile) < self.state['offset']):
+            # The history was replaced, so start over
+            self.rebuild()
+
+        rows, offset = readNewRows(self.historyFile, self.state['offset'])
+        if len(rows) > 0:
+            os.makedirs(self.directory, exist_ok = True)
+            self.truncate()
+            rows = rows.assign(
+                query_datetime = pd.to_datetime(rows['query_datetime'], format = '%Y-%m-%d %H:%M:%S'),
+                leg = rows['returnOrDepart'],
+                fare = pd.to_numeric(rows['fare'], errors = 'coerce').astype(np.float64),
+                duration = pd.to_numeric(rows['duration'], errors = 'coerce').astype(np.float64),
+                stops = pd.to_numeric(rows['stops'], errors = 'coerce').astype(np.float64))
+            rows['qualifyingFare'] = rows['fare'].where(self.qualifying(rows))
+
+            self.updateEvents(rows)
+            lowest = self.updateLowest(rows)
+            self.updateDaily(rows)
+            self.updateDeparture(lowest)
+
+        self.state['offset'] = offset
+        if os.path.isdir(self.directory):
+            for name in APPENDED:
+                if os.path.exists(self.fileName(name)):
+                    self.state['sizes'][name] = os.path.getsize(self.fileName(name))
+            history.writeAtomic(self.fileName('state.json'), json.dumps(self.state))
+            # Only a copy of the saved curve, so it's written after the state and is rewritten next update if this is interrupted
+            history.writeAtomic(self.fileName('departure.csv'), self.departureCurve()[DEPARTURE_COLUMNS].to_csv(index = False))
+        return len(rows)
+
+    def updateEvents(self, rows):
+        key = rows['leg'] + '/' + rows['flight']
+        known = key.isin(self.state['lastFares'].keys()).to_numpy()
+        stateFares = key.map(self.state['lastFares']).astype(np.float64)
+
+        # Previous fare of each row: the row before it for the same flight, or the saved state
+        first = ~key.duplicated().to_numpy()
+        previous = rows['fare'].groupby(key, sort = False).shift().to_numpy()
+        previous = np.where(first, stateFares.to_numpy(), previous)
+        seen = ~first | known
+
+        fare = rows['fare'].to_numpy()
+        nowMissing, wasMissing = np.isnan(fare), np.isnan(previous)
+        direction = np.select(
+            [~seen, nowMissing & ~wasMissing, ~nowMissing & wasMissing, fare > previous, fare < previous],
+            ['new', 'soldOut', 'available', 'up', 'down'], default = '')
+
+        events = rows.assign(previousFare = previous, change = fare - previous, direction = direction)
+        self.appendCsv('events.csv', events[direction != ''], EVENT_COLUMNS)
+
+        # Not groupby().last(), which would skip over a flight selling out
+        last = ~key.duplicated(keep = 'last').to_numpy()
+        lastFares = pd.Series(fare[last], index = key[last].to_numpy())
+        self.state['lastFares'].update(lastFares.astype(object).where(lastFares.notna(), None).to_dict())
+
+    def updateLowest(self, rows):
+        # Scrapes without a qualifying fare are kept (with no fare) so gaps show in the series
+        lowest = rows.groupby(['query_datetime', 'leg'], sort = False)['qualifyingFare'].min().rename('fare').reset_index()
+        qualifying = rows[rows['qualifyingFare'].notna()]
+        best = qualifying.loc[qualifying.groupby(['query_datetime', 'leg'], sort = False)['qualifyingFare'].idxmin(), ['query_datetime', 'leg', 'flight']]
+        lowest = lowest.merge(best, on = ['query_datetime', 'leg'], how = 'left')
+        self.appendCsv('lowest.csv', lowest, LOWEST_COLUMNS)
+        return lowest
+
+    def dailyStatistics(self, fareRows):
+        return fareRows.groupby(['day', 'leg'])['fare'].agg(['min', 'median', 'max', 'count']).reset_index()
+
+    def updateDaily(self, rows):
+        # Only the most recent day can still get more scrapes, so its fares are kept until it's over
+        fareRows = rows.loc[rows['qualifyingFare'].notna(), ['leg', 'qualifyingFare']].rename(columns = {'qualifyingFare': 'fare'})
+        fareRows['day'] = rows['query_datetime'].dt.strftime('%Y-%m-%d')
+        if self.state['openDayFares']:
+            openFares = pd.DataFrame(self.state['openDayFares'], columns = ['leg', 'fare']).assign(day = self.state['openDay'])
+            fareRows = pd.concat([openFares, fareRows], ignore_index = True)
+        if len(fareRows) == 0:
+            return
+
+        openDay = max(fareRows['day'].max(), self.state['openDay'] or '')
+        self.appendCsv('daily.csv', self.dailyStatistics(fareRows[fareRows['day'] < openDay]), DAILY_COLUMNS)
+        self.state['openDay'] = openDay
+        self.state['openDayFares'] = fareRows.loc[fareRows['day'] == openDay, ['leg', 'fare']].values.tolist()
+
+    def updateDeparture(self, lowest):
+        departureDates = {'depart': self.config.get('departureDate'), 'return': self.config.get('returnDate')}
+        departure = pd.to_datetime(lowest['leg'].map(departureDates), errors = 'coerce')
+        lowest = lowest.assign(daysToDeparture = (departure - lowest['query_datetime'].dt.normalize()).dt.days)
+        lowest = lowest.dropna(subset = ['fare', 'daysToDeparture'])
+        curve = lowest.groupby(['leg', 'daysToDeparture'])['fare'].agg(['min', 'max', 'sum', 'count']).reset_index()
+
+        # Small (one row per leg and day), so merged with the saved curve and kept in the state
+        if self.state['departure']:
+            curve = pd.concat([pd.DataFrame(self.state['departure'], columns = DEPARTURE_COLUMNS), curve], ignore_index = True)
+            curve = curve.groupby(['leg', 'daysToDeparture']).agg({'min': 'min', 'max': 'max', 'sum': 'sum', 'count': 'sum'}).reset_index()
+        curve['daysToDeparture'] = curve['daysToDeparture'].astype(int)
+        self.state['departure'] = curve[DEPARTURE_COLUMNS].astype(object).values.tolist()
+
+    def read(self, name, dates = []):
+        fileName = self.fileName(name)
+        if not os.path.exists(fileName):
+            return pd.DataFrame()
+        if name not in APPENDED:
+            return pd.read_csv(fileName, parse_dates = dates, dtype = {'flight': str})
+
+        # Rows past the saved size are from an update that hasn't finished (or was interrupted)
+        with open(fileName, 'rb') as outputFile:
+            data = outputFile.read(self.state['sizes'].get(name, 0))
+        if not data:
+            return pd.DataFrame()
+        return pd.read_csv(io.BytesIO(data), parse_dates = dates, dtype = {'flight': str})
+
+    def events(self):
+        return self.read('events.csv', ['query_datetime'])
+
+    def lowest(self):
+        return self.read('lowest.csv', ['query_datetime'])
+
+    def daily(self):
+        """Daily statistics, including the current day so far"""
+        daily = self.read('daily.csv')
+        if self.state['openDayFares']:
+            openFares = pd.DataFrame(self.state['openDayFares'], columns = ['leg', 'fare']).assign(day = self.state['openDay'])
+            daily = pd.concat([daily, self.dailyStatistics(openFares)], ignore_index = True)
+        return daily
+
+    def departureCurve(self):
+        curve = pd.DataFrame(self.state['departure'], columns = DEPARTURE_COLUMNS)
+        if len(curve):
+            curve['mean'] = curve['sum'] / curve['count']
+        return curve
+
+    def summary(self, changeCount = 5):
+        lines = [self.name]
+        lowest = self.lowest()
+        events = self.events()
+        for leg in ['depart', 'return']:
+            legLowest = lowest[lowest['leg'] == leg].dropna(subset = ['fare']) if len(lowest) else lowest
+            if len(legLowest) == 0:
+                continue
+            latest = legLowest.iloc[-1]
+            best = legLowest.loc[legLowest['fare'].idxmin()]
+            lines.append(f"  {leg}: currently ${int(latest['fare'])} (#{latest['flight']}), lowest ${int(best['fare'])} (#{best['flight']} on {best['query_datetime']})")
+            changes = events[(events['leg'] == leg) & events['direction'].isin(['up', 'down'])].tail(changeCount)
+            for change in changes.itertuples():
+                lines.append(f"    {change.query_datetime} #{change.flight} {change.direction} ${abs(int(change.change))} to ${int(change.fare)}")
+        return '\n'.join(lines)
+
+def update(tripsDir, analyticsDir, trips = [], rebuild = False):
+    for fileName in sorted(glob.glob(os.path.join(tripsDir, '*.csv'))):
+        if fileName.endswith(history.DELTA_SUFFIX):
+            continue
+        analytics = tripAnalytics(fileName, analyticsDir)
+        if trips and (analytics.name not in trips):
+            continue
+        if rebuild:
+            analytics.rebuild()
+        analytics.update()
+        print(analytics.summary())
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "analytics.py: Update and summarize fare analytics for trip CSV history")
+    parser.add_argument('-t', '--tripsDir', dest = 'tripsDir', default = 'trips', help = "Directory containing trip CSV files")
+    parser.add_argument('-o', '--output', dest = 'analyticsDir', default = os.path.join('trips', 'analytics'), help = "Directory to keep the aggregates in")
+    parser.add_argument('-r', '--rebuild', dest = 'rebuild', action = 'store_true', help = "Recompute the aggregates from the whole history")
+    parser.add_argument('trips', nargs = '*', help = "Trip names (CSV file names without .csv) to update, all of them if none are given")
+    args = parser.parse_args()
+
+    update(args.tripsDir, args.analyticsDir, args.trips, args.rebuild)
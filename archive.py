@@ -0,0 +1,154 @@
+import os
+import glob
+import urllib.parse
+
+import pandas as pd
+
+import history
+
+# Compact dtypes for the archive. Flight numbers, times and legs repeat on every scrape so they're
+# stored as categoricals, fares fit in a nullable int16 (missing fares stay missing)
+ARCHIVE_DTYPES = {
+    'returnOrDepart': 'category',
+    'flight': 'category',
+    'departTime': 'category',
+    'arriveTime': 'category',
+    'duration': 'float32',
+    'stops': 'Int8',
+    'fare': 'Int16',
+    'fareAnytime': 'Int16',
+    'fareBusinessSelect': 'Int16',
+}
+
+QUERY_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def arrow():
+    # importing this way keeps people who aren't interested in the archive from installing pyarrow..
+    pyarrow = __import__('pyarrow.dataset')
+    __import__('pyarrow.parquet')
+    __import__('pyarrow.compute')
+    return pyarrow
+
+def archiveSchema(pyarrow):
+    return pyarrow.schema([
+        ('query_datetime', pyarrow.timestamp('s')),
+        ('returnOrDepart', pyarrow.dictionary(pyarrow.int8(), pyarrow.string())),
+        ('flight', pyarrow.dictionary(pyarrow.int16(), pyarrow.string())),
+        ('departTime', pyarrow.dictionary(pyarrow.int16(), pyarrow.string())),
+        ('arriveTime', pyarrow.dictionary(pyarrow.int16(), pyarrow.string())),
+        ('duration', pyarrow.float32()),
+        ('stops', pyarrow.int8()),
+        ('fare', pyarrow.int16()),
+        ('fareAnytime', pyarrow.int16()),
+        ('fareBusinessSelect', pyarrow.int16()),
+    ])
+
+def partitioning(pyarrow):
+    return pyarrow.dataset.partitioning(pyarrow.schema([('trip', pyarrow.string()), ('query_date', pyarrow.string())]), flavor = 'hive')
+
+def readCsv(fileName):
+    """Reads a trip's CSV history into a DataFrame with the archive's compact dtypes"""
+    frame = pd.read_csv(fileName, dtype = {'flight': str, 'departTime': str, 'arriveTime': str, 'returnOrDepart': str})
+    frame['query_datetime'] = pd.to_datetime(frame['query_datetime'], format = QUERY_DATETIME_FORMAT)
+    for column, dtype in ARCHIVE_DTYPES.items():
+        if dtype.startswith('Int'):
+            # Fares written through pandas are floats (129.0)
+            frame[column] = pd.to_numeric(frame[column], errors = 'coerce').round().astype(dtype)
+        else:
+            frame[column] = frame[column].astype(dtype)
+    return frame[history.COLUMNS]
+
+def tripDirectory(archiveDir, trip):
+    return os.path.join(archiveDir, 'trip=' + urllib.parse.quote(history.tripName(trip), safe = ''))
+
+def latestArchived(archiveDir, trip):
+    """Returns the newest query_datetime archived for a trip, reading only the newest partition"""
+    pyarrow = arrow()
+
+    partitions = sorted(glob.glob(os.path.join(tripDirectory(archiveDir, trip), 'query_date=*')))
+    if not partitions:
+        return None
+    table = pyarrow.dataset.dataset(partitions[-1], format = 'parquet').to_table(columns = ['query_datetime'])
+    if table.num_rows == 0:
+        return None
+    return pd.Timestamp(pyarrow.compute.max(table['query_datetime']).as_py())
+
+def archiveCsv(fileName, archiveDir):
+    """
+    Appends the scrapes in a trip's CSV history that aren't archived yet, as one Parquet file per
+    query date under trip=<name>/query_date=<YYYY-MM-DD>. Returns the number of rows written
+    """
+    pyarrow = arrow()
+    schema = archiveSchema(pyarrow)
+
+    trip = os.path.splitext(os.path.basename(fileName))[0]
+    frame = readCsv(fileName)
+    latest = latestArchived(archiveDir, trip)
+    if latest is not None:
+        frame = frame[frame['query_datetime'] > latest]
+    frame = frame.sort_values('query_datetime', kind = 'stable')
+
+    for queryDate, day in frame.groupby(frame['query_datetime'].dt.strftime('%Y-%m-%d')):
+        directory = os.path.join(tripDirectory(archiveDir, trip), 'query_date=' + queryDate)
+        os.makedirs(directory, exist_ok = True)
+
+        table = pyarrow.Table.from_pandas(day, preserve_index = False).cast(schema)
+        # Parts are named after their first scrape, so archiving more of the same day adds a file
+        partName = 'part-' + day['query_datetime'].iloc[0].strftime('%Y%m%dT%H%M%S') + '.parquet'
+        tempFileName = os.path.join(directory, '.' + partName + '.tmp')
+        pyarrow.parquet.write_table(table, tempFileName, compression = 'zstd')
+        os.replace(tempFileName, os.path.join(directory, partName))
+
+    return len(frame)
+
+def archive(tripsDir, archiveDir):
+    for fileName in sorted(glob.glob(os.path.join(tripsDir, '*.csv'))):
+        if fileName.endswith(history.DELTA_SUFFIX):
+            continue
+        print(fileName + ": archived " + str(archiveCsv(fileName, archiveDir)) + " rows")
+
+def load(archiveDir, trips = None, columns = None, since = None, until = None, flights = None, returnOrDepart = None):
+    """
+    Loads archived history as a DataFrame. Only the requested columns are read, and the filters
+    are pushed down: trips and dates skip whole partitions, and the rest is checked against each
+    row group's statistics before any data is decoded. since/until are datetimes or strings
+    """
+    pyarrow = arrow()
+    field = pyarrow.dataset.field
+
+    conditions = []
+    if trips is not None:
+        conditions.append(field('trip').isin([history.tripName(trip) for trip in trips]))
+    if since is not None:
+        since = pd.Timestamp(since)
+        conditions.append(field('query_date') >= since.strftime('%Y-%m-%d'))
+        conditions.append(field('query_datetime') >= pyarrow.scalar(since.to_pydatetime(), pyarrow.timestamp('s')))
+    if until is not None:
+        until = pd.Timestamp(until)
+        conditions.append(field('query_date') <= until.strftime('%Y-%m-%d'))
+        conditions.append(field('query_datetime') <= pyarrow.scalar(until.to_pydatetime(), pyarrow.timestamp('s')))
+    if flights is not None:
+        conditions.append(field('flight').isin(list(flights)))
+    if returnOrDepart is not None:
+        conditions.append(field('returnOrDepart') == returnOrDepart)
+
+    condition = None
+    for part in conditions:
+        condition = part if condition is None else condition & part
+
+    dataset = pyarrow.dataset.dataset(archiveDir, format = 'parquet', partitioning = partitioning(pyarrow), exclude_invalid_files = True)
+    table = dataset.to_table(columns = columns, filter = condition)
+
+    # Keep missing fares as <NA> rather than turning the whole column into floats
+    integerTypes = {pyarrow.int8(): pd.Int8Dtype(), pyarrow.int16(): pd.Int16Dtype()}
+    return table.to_pandas(types_mapper = integerTypes.get)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "archive.py: Archive trip CSV history as partitioned Parquet files")
+    parser.add_argument('-t', '--tripsDir', dest = 'tripsDir', default = 'trips', help = "Directory containing trip CSV files")
+    parser.add_argument('-a', '--archive', dest = 'archiveDir', default = os.path.join('trips', 'archive'), help = "Directory to write the archive to")
+    args = parser.parse_args()
+
+    archive(args.tripsDir, args.archiveDir)
@@ -0,0 +1,119 @@
+import threading
+
+import swa
+import ratelimit
+
+# A backend is anything with a scrape() method taking the trip query parameters and returning
+# (departFlights, returnFlights) in the format produced by swa.scrape. Backends given the same
+# ratelimit.governor share its rate limit and circuit breaker
+
+class seleniumBackend(object):
+
+    def __init__(self, driver, extraction = 'bulk', debug = False, name = '', governor = None):
+        self.type = 'selenium'
+        self.governor = governor or ratelimit.governor()
+        self.name = name
+        self.driver = driver
+        self.extraction = extraction
+        self.debug = debug
+        # Time spent in each phase of the most recent scrape (see swa.scrape)
+        self.timings = {}
+
+    def scrape(self, **query):
+        with self.governor.request(query):
+            return swa.scrape(driver = self.driver, debug = self.debug, extraction = self.extraction, timings = self.timings, **query)
+
+    def close(self):
+        self.driver.quit()
+
+class browserFault(Exception):
+    """The browser crashed or stopped responding, which isn't a problem with the query"""
+    pass
+
+class browserPool(object):
+    """
+    Scrapes with one of a pool (queue.Queue) of seleniumBackends, only checking one out while a page
+    is loaded. Its browser is checked (and replaced if need be) by driverManager.acquire() first, and
+    the page load is counted by driverManager.release() after. Queries answered by a cache.resultCache
+    never get here, so they neither wait on a browser nor count as page loads
+    """
+
+    def __init__(self, browsers, driverManager, released = None):
+        self.type = 'selenium'
+        self.browsers = browsers
+        self.driverManager = driverManager
+        # Called with the backend after each page load, while it's still checked out
+        self.released = released
+        self.local = threading.local()
+
+    @property
+    def timings(self):
+        """Time spent in each phase of the calling thread's most recent scrape (see swa.scrape)"""
+        if not hasattr(self.local, 'timings'):
+            self.local.timings = {}
+        return self.local.timings
+
+    def scrape(self, **query):
+        backend = self.browsers.get()
+        try:
+            if not self.driverManager.acquire(backend):
+                raise browserFault("Browser could not be restarted")
+
+            loaded = True
+            backend.timings.clear()
+            try:
+                return backend.scrape(**query)
+            except ratelimit.circuitOpen:
+                # Refused before a page was loaded
+                loaded = False
+                raise
+            except (swa.scrapeValidation, swa.scrapeDatePast, swa.scrapeDatesNotOpen, swa.scrapeTimeout):
+                raise
+            except Exception as e:
+                if not self.driverManager.healthy(backend.driver):
+                    raise browserFault("Browser stopped responding - " + str(e)) from e
+                raise
+            finally:
+                self.timings.update(backend.timings)
+                if loaded:
+                    # The page was loaded even if the scrape failed
+                    self.driverManager.release(backend)
+                    if self.released:
+                        self.released(backend)
+        finally:
+            self.browsers.put(backend)
+
+class httpBackend(object):
+
+    def __init__(self, url = swa.API_URL, apiKey = '', poolSize = 10, debug = False, governor = None):
+        self.type = 'http'
+        self.governor = governor or ratelimit.governor()
+        self.url = url
+        self.debug = debug
+        self.session = swa.createSession(poolSize, apiKey)
+
+    def scrape(self, **query):
+        with self.governor.request(query):
+            return swa.scrapeHttp(session = self.session, url = self.url, debug = self.debug, **query)
+
+    def close(self):
+        self.session.close()
+
+class queueBackend(object):
+    """
+    Scrapes by submitting a job to a jobqueue.jobQueue and waiting for a worker process to finish it
+    """
+
+    def __init__(self, jobs, backend = 'selenium', timeout = 600, governor = None):
+        self.type = 'queue'
+        self.governor = governor or ratelimit.governor()
+        self.jobs = jobs
+        self.backend = backend
+        self.timeout = timeout
+
+    def scrape(self, **query):
+        with self.governor.request(query):
+            return self.jobs.wait(self.jobs.submit(self.backend, query), self.timeout)
+
+    def close(self):
+        pass
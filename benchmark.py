@@ -0,0 +1,206 @@
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import threading
+import statistics
+import http.server
+
+import swa
+import browser
+import configuration
+
+DEFAULT_SIZES = "5,20,60,150,300"
+DEFAULT_BASELINE_FILE = "benchmark-baseline.json"
+
+def fareText(fare, rng):
+    return ("$" + str(fare)) if fare else rng.choice(["Sold out", "Unavailable"])
+
+def generateFlight(rng):
+    """Returns (flight details as swa.scrape would return them, html for the row)"""
+    flightNumbers = [str(rng.randint(1, 9999)) for i in range(rng.choice([1, 1, 2]))]
+    stops = len(flightNumbers) - 1 if rng.random() < 0.8 else len(flightNumbers)
+    hours, minutes = rng.randint(1, 9), rng.randint(0, 59)
+    departHour, arriveHour = rng.randint(1, 12), rng.randint(1, 12)
+    departTime = str(departHour) + ":" + str(rng.randint(0, 59)).zfill(2) + rng.choice(["AM", "PM"])
+    arriveTime = str(arriveHour) + ":" + str(rng.randint(0, 59)).zfill(2) + rng.choice(["AM", "PM"])
+    nextDay = rng.random() < 0.1
+    # Roughly 1 in 5 fares are sold out or unavailable
+    fares = [rng.randint(49, 999) if rng.random() < 0.8 else None for i in range(3)]
+
+    flight = {
+        'flight': '/'.join(flightNumbers),
+        'departTime': departTime,
+        'arriveTime': arriveTime,
+        'duration': round(hours + ((minutes / 60.0) + .001), 2),
+        'stops': stops,
+        'fare': fares[0],
+        'fareAnytime': fares[1],
+        'fareBusinessSelect': fares[2]
+    }
+
+    html = '<li class="air-booking-select-detail">' \
+        '<div class="select-detail--flight-numbers"><span class="flight-numbers--flight-number"># ' + ' / '.join(flightNumbers) + '</span></div>' \
+        '<div class="select-detail--time">' + departTime + '</div>' \
+        '<div class="select-detail--time">' + arriveTime + ('<div class="select-detail--indicator">Next Day</div>' if nextDay else '') + '</div>' \
+        '<div class="select-detail--flight-duration">' + str(hours) + 'h ' + str(minutes) + 'm</div>' \
+        '<div class="flight-stops-badge">' + ('Nonstop' if stops == 0 else (str(stops) + ' stop' + ('s' if stops > 1 else ''))) + '</div>' \
+        '<button class="fare-button fare-button_primary-yellow">' + fareText(fares[0], rng) + '</button>' \
+        '<button class="fare-button fare-button_secondary-light-blue">' + fareText(fares[1], rng) + '</button>' \
+        '<button class="fare-button fare-button_fare-type-color">' + fareText(fares[2], rng) + '</button>' \
+        '</li>'
+
+    return flight, html
+
+def generatePage(flightCount, tripType = 'roundtrip', seed = 0):
+    """
+    Returns (html, departFlights, returnFlights) for a synthetic booking results page with
+    flightCount flights per leg, using the same class names as the SWA booking page
+    """
+    rng = random.Random(seed)
+    legs = 2 if tripType == 'roundtrip' else 1
+
+    matrixes, flights = [], []
+    for leg in range(legs):
+        rows = [generateFlight(rng) for i in range(flightCount)]
+        flights.append([row[0] for row in rows])
+        matrixes.append('<div id="air-booking-product-' + str(leg) + '"><ul class="air-booking-select-price-matrix">' + \
+            ''.join([row[1] for row in rows]) + '</ul></div>')
+
+    html = '<!DOCTYPE html><html><head><title>Select Flights</title></head><body>' + ''.join(matrixes) + '</body></html>'
+    return html, flights[0], (flights[1] if legs > 1 else [])
+
+class pageServer(object):
+    """Serves whatever page is currently set for every request, on a free local port"""
+
+    def __init__(self):
+        server = self
+
+        class handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = server.page.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.page = ''
+        self.httpServer = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.url = "http://127.0.0.1:" + str(self.httpServer.server_port) + "/air/booking/select.html"
+        threading.Thread(target = self.httpServer.serve_forever, daemon = True).start()
+
+    def close(self):
+        self.httpServer.shutdown()
+
+def benchmarkParse(sizes, repeat):
+    """Times the browser-free html parser alone, which needs neither a browser nor a server"""
+    results = {}
+    for tripType in ['oneway', 'roundtrip']:
+        for size in sizes:
+            html, departFlights, returnFlights = generatePage(size, tripType)
+            samples = []
+            for i in range(repeat):
+                start = time.time()
+                priceMatrixes = swa.parseFlightsHtml(html)
+                samples.append(time.time() - start)
+            if swa.splitFlights(tripType, priceMatrixes) != (departFlights, returnFlights):
+                raise Exception("html parser returned different flights than generated for " + tripType + " " + str(size))
+            results["parse/" + tripType + "/" + str(size)] = {'extraction': statistics.median(samples)}
+    return results
+
+def benchmarkScrape(driver, server, sizes, repeat, extraction):
+    departureDate = (datetime.datetime.now().date() + datetime.timedelta(days = 30)).strftime("%Y-%m-%d")
+    returnDate = (datetime.datetime.now().date() + datetime.timedelta(days = 33)).strftime("%Y-%m-%d")
+
+    results = {}
+    for tripType in ['oneway', 'roundtrip']:
+        for size in sizes:
+            server.page, departFlights, returnFlights = generatePage(size, tripType)
+            samples = []
+            for i in range(repeat):
+                timings = {}
+                start = time.time()
+                flights = swa.scrape(driver, 'SAN', 'DEN', departureDate, returnDate, tripType = tripType,
+                    extraction = extraction, url = server.url, timings = timings)
+                timings['endToEnd'] = time.time() - start
+                samples.append(timings)
+            if flights != (departFlights, returnFlights):
+                raise Exception(extraction + " extraction returned different flights than generated for " + tripType + " " + str(size))
+            phases = sorted(set(phase for sample in samples for phase in sample))
+            results[extraction + "/" + tripType + "/" + str(size)] = dict((phase, statistics.median([sample.get(phase, 0) for sample in samples])) for phase in phases)
+    return results
+
+def compareBaseline(results, baseline, threshold):
+    """Returns a list of descriptions of every end to end (or extraction) time that regressed past threshold"""
+    regressions = []
+    for name, timings in results.items():
+        phase = 'endToEnd' if 'endToEnd' in timings else 'extraction'
+        if (name not in baseline) or (phase not in baseline[name]) or (baseline[name][phase] <= 0):
+            continue
+        change = (timings[phase] - baseline[name][phase]) / baseline[name][phase]
+        if change > threshold:
+            regressions.append(name + " " + phase + " " + "%.4fs" % timings[phase] + " vs baseline " + "%.4fs" % baseline[name][phase] + " (+" + "%.0f" % (change * 100) + "%)")
+    return regressions
+
+def printResults(results):
+    for name, timings in results.items():
+        print(name.ljust(28) + "  ".join([phase + "=" + "%.4fs" % value for phase, value in timings.items()]))
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description = "benchmark.py: Measures scrape performance against synthetic SWA result pages served locally")
+    parser.add_argument('-f', '--file', dest = 'configurationFile', default = 'swatcher.ini',
+        help = "Configuration file for the browser to use (not needed with --parse-only)")
+    parser.add_argument('-s', '--sizes', dest = 'sizes', default = DEFAULT_SIZES, help = "Comma separated flights per leg to test")
+    parser.add_argument('-r', '--repeat', dest = 'repeat', type = int, default = 3, help = "Times to repeat each measurement (median is reported)")
+    parser.add_argument('-e', '--extraction', dest = 'extraction', default = 'bulk,html,element', help = "Comma separated extraction methods to test")
+    parser.add_argument('-p', '--parse-only', dest = 'parseOnly', action = 'store_true', help = "Only benchmark the html parser, without a browser")
+    parser.add_argument('-b', '--baseline', dest = 'baselineFile', default = DEFAULT_BASELINE_FILE, help = "Baseline results to compare against")
+    parser.add_argument('--save-baseline', dest = 'saveBaseline', action = 'store_true', help = "Save these results as the new baseline")
+    parser.add_argument('-t', '--threshold', dest = 'threshold', type = float, default = 0.25, help = "Fractional slowdown that counts as a regression")
+    return parser.parse_args()
+
+def main():
+    args = parseArguments()
+    sizes = [int(x) for x in args.sizes.split(',')]
+
+    results = benchmarkParse(sizes, args.repeat)
+
+    if not args.parseOnly:
+        config = configuration.configuration(args.configurationFile)
+        server = pageServer()
+        driver = browser.createDriver(config.browser, config.browserProfile, config.blockedUrls)
+        try:
+            for extraction in args.extraction.split(','):
+                results.update(benchmarkScrape(driver, server, sizes, args.repeat, extraction))
+        finally:
+            driver.quit()
+            server.close()
+
+    printResults(results)
+
+    if args.saveBaseline:
+        with open(args.baselineFile, 'w') as baselineFile:
+            json.dump(results, baselineFile, indent = 2)
+        print("Saved baseline to '" + args.baselineFile + "'")
+        return 0
+
+    try:
+        with open(args.baselineFile) as baselineFile:
+            baseline = json.load(baselineFile)
+    except IOError:
+        print("No baseline '" + args.baselineFile + "' to compare against, use --save-baseline to create one")
+        return 0
+
+    regressions = compareBaseline(results, baseline, args.threshold)
+    for regression in regressions:
+        print("REGRESSION: " + regression)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import socket
+import selenium
+import selenium.webdriver
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.87 Safari/537.36"
+
+# URL patterns blocked by the lean profile - images, media, fonts, and third party tracking/ad tags,
+# none of which are needed to read fares
+LEAN_BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.webp', '*.ico',
+    '*.mp4', '*.webm', '*.mp3',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*doubleclick.net*', '*google-analytics.com*', '*googletagmanager.com*', '*googleadservices.com*',
+    '*facebook.net*', '*facebook.com*', '*bing.com*', '*adobedtm.com*', '*demdex.net*', '*omtrdc.net*',
+    '*qualtrics.com*', '*pinterest.com*', '*twitter.com*', '*snapchat.com*', '*tiktok.com*'
+]
+
+def freePort():
+    # Let the OS pick a port nothing is listening on, so any number of browsers can run at once
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def createChrome(config, lean, blockedUrls):
+    options = selenium.webdriver.ChromeOptions()
+    options.add_experimental_option("excludeSwitches", ['enable-automation'])
+    options.add_argument("user-agent=" + USER_AGENT)
+    options.add_argument("--remote-debugging-port=" + str(freePort()))
+    options.add_argument("log-level=" + str(config.logLevel))
+
+    if lean:
+        options.add_argument('--headless=new')
+        options.page_load_strategy = 'eager'
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_argument('--disk-cache-size=1')
+        options.add_argument('--media-cache-size=1')
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
+    service = selenium.webdriver.chrome.service.Service(executable_path=config.binaryLocation)
+    driver = selenium.webdriver.Chrome(service=service, options=options)
+
+    if lean:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': LEAN_BLOCKED_URLS + blockedUrls})
+    else:
+        driver.minimize_window()
+
+    return driver
+
+def createFirefox(config, lean, blockedUrls):
+    options = selenium.webdriver.firefox.options.Options()
+    options.binary_location = config.binaryLocation
+    options.add_argument('--headless')
+
+    if lean:
+        # Firefox has no equivalent of Chrome's URL blocking, so only images, fonts, media and caching are turned off
+        options.page_load_strategy = 'eager'
+        options.set_preference('permissions.default.image', 2)
+        options.set_preference('gfx.downloadable_fonts.enabled', False)
+        options.set_preference('media.autoplay.default', 5)
+        options.set_preference('browser.cache.disk.enable', False)
+        options.set_preference('browser.cache.memory.enable', False)
+
+    return selenium.webdriver.Firefox(options = options)
+
+def createDriver(browserConfig, profile = 'standard', blockedUrls = []):
+
+    lean = profile == 'lean'
+
+    if browserConfig.type == 'chrome': # Or Chromium
+        return createChrome(browserConfig, lean, blockedUrls)
+    elif browserConfig.type == 'firefox': # Or Iceweasel
+        return createFirefox(browserConfig, lean, blockedUrls)
+    else:
+        raise Exception("Unsupported web browser '" + browserConfig.type + "' specified")
+
+def browserMemory(driver):
+    """
+    Returns the resident memory (in MB) of the browser behind a driver, including all its child
+    processes, or None if it can't be determined (psutil isn't installed)
+    """
+    try:
+            # importing this way keeps people who aren't interested in memory limits from installing psutil..
+        psutil = __import__('psutil')
+        process = psutil.Process(driver.service.process.pid)
+        return sum(p.memory_info().rss for p in [process] + process.children(recursive = True)) / (1024 * 1024)
+    except Exception:
+        return None
+
+class driverManager(object):
+    """
+    Looks after the browsers used by the selenium backends:
+        - before each scrape the browser is checked, and replaced if it crashed or stopped responding
+        - after maxPageLoads scrapes, or once it uses more than maxMemory MB, a browser is recycled
+        - spare browsers are started in the background, so replacing one doesn't wait on startup
+    """
+
+    def __init__(self, factory, maxPageLoads = 100, maxMemory = 0, spares = 1):
+        import queue
+        import threading
+
+        self.factory = factory
+        self.maxPageLoads = maxPageLoads
+        self.maxMemory = maxMemory
+        self.sparesWanted = spares
+        self.spares = queue.Queue()
+        self.pageLoads = {}
+        self.lock = threading.Lock()
+        self.threading = threading
+        self.closed = False
+        self.restarts = 0
+        self.recycles = 0
+
+        for i in range(spares):
+            self.warmUp()
+
+    def create(self):
+        driver = self.factory()
+        with self.lock:
+            self.pageLoads[id(driver)] = 0
+        return driver
+
+    def warmUp(self):
+        def run():
+            try:
+                driver = self.create()
+            except Exception as e:
+                print("Unable to start spare browser - " + str(e))
+                return
+            if self.closed:
+                self.retire(driver)
+            else:
+                self.spares.put(driver)
+
+        self.threading.Thread(target = run, name = 'browser-warmup', daemon = True).start()
+
+    def replacement(self):
+        import queue
+
+        try:
+            driver = self.spares.get_nowait()
+        except queue.Empty:
+            # No spare is ready yet, so this one has to wait on the browser starting
+            driver = self.create()
+
+        if self.sparesWanted:
+            self.warmUp()
+        return driver
+
+    def retire(self, driver):
+        with self.lock:
+            self.pageLoads.pop(id(driver), None)
+
+        def run():
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+        self.threading.Thread(target = run, name = 'browser-quit', daemon = True).start()
+
+    def healthy(self, driver):
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def acquire(self, backend):
+        """
+        Makes sure the backend's browser is working before it is used. Returns False if it wasn't
+        and a replacement couldn't be started, in which case it's tried again on the next acquire
+        """
+        if self.healthy(backend.driver):
+            return True
+
+        self.restarts += 1
+        try:
+            driver = self.replacement()
+        except Exception as e:
+            print("Unable to start replacement browser - " + str(e))
+            return False
+        self.retire(backend.driver)
+        backend.driver = driver
+        return True
+
+    def release(self, backend):
+        """Counts a scrape against the backend's browser, recycling the browser if it is worn out"""
+        with self.lock:
+            pageLoads = self.pageLoads.get(id(backend.driver), 0) + 1
+            self.pageLoads[id(backend.driver)] = pageLoads
+
+        memory = browserMemory(backend.driver) if self.maxMemory else None
+        if ((self.maxPageLoads and (pageLoads >= self.maxPageLoads)) or (memory and (memory > self.maxMemory))):
+            try:
+                driver = self.replacement()
+            except Exception as e:
+                # Keep using the worn out browser, it will be recycled after the next scrape instead
+                print("Unable to start replacement browser - " + str(e))
+                return
+            self.recycles += 1
+            self.retire(backend.driver)
+            backend.driver = driver
+
+    def close(self):
+        import queue
+
+        self.closed = True
+        while True:
+            try:
+                self.spares.get_nowait().quit()
+            except queue.Empty:
+                break
+            except Exception:
+                pass
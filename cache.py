@@ -0,0 +1,111 @@
+import time
+import threading
+import collections
+import concurrent.futures
+
+import swa
+
+def legKeys(query):
+    """
+    Returns the normalized keys for the legs of a query, (depart, return) for a roundtrip or just
+    (depart,) for a oneway. SWA prices each leg of a roundtrip separately, so a leg scraped as part
+    of a roundtrip can answer a oneway query for the same flight (and the other way around)
+    """
+    departKey = (
+        query['originationAirportCode'].upper(),
+        query['destinationAirportCode'].upper(),
+        query['departureDate'],
+        swa.validateTimeOfDay(query.get('departureTimeOfDay', 'ALL_DAY')),
+        query.get('adultPassengersCount', 1)
+    )
+    if query.get('tripType', 'roundtrip') != 'roundtrip':
+        return (departKey,)
+
+    returnKey = (
+        query['destinationAirportCode'].upper(),
+        query['originationAirportCode'].upper(),
+        query['returnDate'],
+        swa.validateTimeOfDay(query.get('returnTimeOfDay', 'ALL_DAY')),
+        query.get('adultPassengersCount', 1)
+    )
+    return (departKey, returnKey)
+
+class resultCache(object):
+    """
+    Caches scraped flights per leg for ttl seconds (evicting the least recently used once there are
+    more than maxEntries legs), and coalesces identical queries made while one is already being
+    scraped, so trips sharing a leg only cause a single page load
+    """
+
+    def __init__(self, ttl = 120, maxEntries = 128):
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.entries = collections.OrderedDict()
+        self.inFlight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, keys):
+        now = time.time()
+        flights = []
+        for key in keys:
+            entry = self.entries.get(key)
+            if (entry is None) or (entry[0] < now):
+                return None
+            self.entries.move_to_end(key)
+            flights.append(entry[1])
+        return flights
+
+    def store(self, keys, flights):
+        expires = time.time() + self.ttl
+        for key, legFlights in zip(keys, flights):
+            self.entries[key] = (expires, legFlights)
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last = False)
+
+    def scrape(self, backend, query):
+        """
+        Returns (departFlights, returnFlights) for query, from the cache if possible, otherwise
+        from backend.scrape(**query). The returned lists are shared, so must not be modified
+        """
+        try:
+            keys = legKeys(query)
+        except swa.scrapeValidation:
+            # Let the backend report the problem with the query
+            return backend.scrape(**query)
+
+        with self.lock:
+            flights = self.lookup(keys) if self.ttl > 0 else None
+            if flights is not None:
+                self.hits += 1
+                return flights[0], (flights[1] if len(flights) > 1 else [])
+
+            future = self.inFlight.get(keys)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = concurrent.futures.Future()
+                self.inFlight[keys] = future
+            else:
+                self.hits += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            departFlights, returnFlights = backend.scrape(**query)
+        except BaseException as e:
+            with self.lock:
+                del self.inFlight[keys]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            if self.ttl > 0:
+                self.store(keys, [departFlights, returnFlights][:len(keys)])
+            del self.inFlight[keys]
+        future.set_result((departFlights, returnFlights))
+
+        return departFlights, returnFlights
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+import history
+
+VERSION = 1
+
+# Journal records are folded into a new checkpoint once there are this many
+COMPACT_INTERVAL = 500
+
+def tripKey(trip):
+    # Trips are matched by their settings rather than their position, so adding or reordering
+    # [trip-N] sections keeps each trip's state, while changing a trip's settings starts it afresh
+    settings = json.dumps(history.tripConfig(trip), sort_keys = True)
+    return trip.description + '#' + hashlib.sha1(settings.encode('utf-8')).hexdigest()[:12]
+
+def planKey(plan):
+    legs = json.dumps(sorted(tripKey(leg) for leg in plan.legs))
+    return plan.description + '#' + hashlib.sha1(legs.encode('utf-8')).hexdigest()[:12]
+
+def load(fileName):
+    """Returns the saved checkpoint, or an empty one if there isn't a (readable) checkpoint"""
+    empty = {'version': VERSION, 'trips': {}, 'plans': {}}
+    try:
+        with open(fileName) as checkpointFile:
+            saved = json.load(checkpointFile)
+    except FileNotFoundError:
+        return empty
+    except (IOError, ValueError) as e:
+        print("Ignoring unreadable checkpoint '" + fileName + "': " + str(e))
+        return empty
+
+    if saved.get('version') != VERSION:
+        print("Ignoring checkpoint '" + fileName + "' from a different version of swatcher")
+        return empty
+    return saved
+
+def save(fileName, trips, plans):
+    os.makedirs(os.path.dirname(fileName) or '.', exist_ok = True)
+    # writeAtomic replaces the file in one step, so a crash leaves either the old or new checkpoint
+    history.writeAtomic(fileName, json.dumps({
+        'version': VERSION,
+        'saved': time.time(),
+        'trips': trips,
+        'plans': plans
+    }))
+
+class journal(object):
+    """
+    Saves trip and plan state as a checkpoint (fileName) plus a journal of the records that changed
+    since (fileName + '.journal', a line of JSON each), so saving after a query only appends the
+    state of the trip that was queried. Once the journal has COMPACT_INTERVAL records, it's folded
+    into a new checkpoint and emptied.
+
+    Records are saved with a stamp that increases in the order their state was read, and a record
+    older than the one already saved for its key is dropped, so the journal never goes backwards
+    when two threads save at once
+    """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.journalFileName = fileName + '.journal'
+        self.saved = {'trips': {}, 'plans': {}}
+        self.stamps = {}
+        self.length = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Returns the checkpoint with the journal applied to it"""
+        saved = load(self.fileName)
+        self.saved = {'trips': saved['trips'], 'plans': saved['plans']}
+        self.length = 0
+
+        try:
+            # A partial last line (from a crash while appending) is dropped, so appending starts on a clean line
+            history.repairTail(self.journalFileName)
+            with open(self.journalFileName) as journalFile:
+                for line in journalFile:
+                    record = json.loads(line)
+                    if record.get('version') != saved['version']:
+                        continue
+                    for kind in ['trips', 'plans']:
+                        self.saved[kind].update(record.get(kind, {}))
+                    self.length += 1
+        except FileNotFoundError:
+            pass
+        except (IOError, ValueError) as e:
+            print("Ignoring unreadable checkpoint journal '" + self.journalFileName + "': " + str(e))
+
+        return self.saved
+
+    def save(self, stamp, trips, plans = {}):
+        with self.lock:
+            # Drop records whose state was read before the state already saved
+            trips = dict((key, value) for key, value in trips.items() if self.stamps.get(('trips', key), -1) < stamp)
+            plans = dict((key, value) for key, value in plans.items() if self.stamps.get(('plans', key), -1) < stamp)
+            if not (trips or plans):
+                return
+            for kind, records in [('trips', trips), ('plans', plans)]:
+                for key in records:
+                    self.stamps[(kind, key)] = stamp
+                self.saved[kind].update(records)
+
+            if self.length + 1 >= COMPACT_INTERVAL:
+                save(self.fileName, self.saved['trips'], self.saved['plans'])
+                # Only emptied once the new checkpoint is in place. If that's interrupted, replaying
+                # the journal over the new checkpoint gives the same state
+                open(self.journalFileName, 'w').close()
+                self.length = 0
+                return
+
+            os.makedirs(os.path.dirname(self.journalFileName) or '.', exist_ok = True)
+            with open(self.journalFileName, 'a') as journalFile:
+                journalFile.write(json.dumps({'version': VERSION, 'trips': trips, 'plans': plans}) + '\n')
+                journalFile.flush()
+                os.fsync(journalFile.fileno())
+            self.length += 1
@@ -1,6 +1,8 @@
 import configparser
 import re
 
+import planner
+
 class configurationNotificationSmtp(object):
 
 	def __init__(self, cp):
@@ -104,9 +106,30 @@ class configurationBrowserFirefox(object):
 
 
 
+class configurationBackendHttp(object):
+
+	def __init__(self, cp, workers):
+
+		self.type = 'http'
+
+			# Unlike browsers, everything here has a default, so the section is optional
+		self.url = cp.get('http', 'url') if cp.has_option('http', 'url') else ''
+		self.apiKey = cp.get('http', 'apiKey') if cp.has_option('http', 'apiKey') else ''
+		self.poolSize = cp.getint('http', 'poolSize') if cp.has_option('http', 'poolSize') else max(workers, 1)
+
+class configurationQueue(object):
+
+	def __init__(self, cp):
+
+			# Without a database, trips are scraped by this process rather than through a queue
+		self.database = cp.get('queue', 'database') if cp.has_option('queue', 'database') else ''
+		self.leaseTime = cp.getint('queue', 'leaseTime') if cp.has_option('queue', 'leaseTime') else 300
+		self.maxAttempts = cp.getint('queue', 'maxAttempts') if cp.has_option('queue', 'maxAttempts') else 3
+		self.jobTimeout = cp.getint('queue', 'jobTimeout') if cp.has_option('queue', 'jobTimeout') else 600
+
 class configurationTrip(object):
 
-	def __init__(self, cp, section, index):
+	def __init__(self, cp, section, index, backend = 'selenium'):
 
 		self.index = index
 
@@ -138,6 +161,7 @@ class configurationTrip(object):
 		self.departureTimeOfDay = cp.get(section, 'departureTimeOfDay') if cp.has_option(section,'departureTimeOfDay') else 'anytime'
 
 		self.returnDate = cp.get(section, 'returnDate') if cp.has_option(section,'returnDate') else ''
+		self.stayLength = cp.get(section, 'stayLength') if cp.has_option(section,'stayLength') else ''
 		self.returnTimeOfDay = cp.get(section, 'returnTimeOfDay') if cp.has_option(section,'returnTimeOfDay') else 'anytime'
 
 		self.specificFlights = cp.get(section, 'specificFlights') if cp.has_option(section,'specificFlights') else ''
@@ -152,6 +176,17 @@ class configurationTrip(object):
 
 		self.maxDuration = cp.getfloat(section, 'maxDuration') if cp.has_option(section,'maxDuration') else 0.0
 
+		self.pollInterval = None
+		if(cp.has_option(section, 'pollInterval') and (cp.getint(section, 'pollInterval') >= 5)):
+			self.pollInterval = cp.getint(section, 'pollInterval')
+
+		self.backend = cp.get(section, 'backend') if cp.has_option(section, 'backend') else backend
+		if(self.backend not in ['selenium', 'http']):
+			raise Exception("For section '" + section + "', unrecognized backend '" + self.backend + "'")
+
+			# Set on the legs a flexible trip is expanded into
+		self.plan = None
+
 class configuration(object):
 
 	def __init__(self, configurationFile):
@@ -166,11 +201,29 @@ class configuration(object):
 		if(cp.has_option('global', 'pollInterval') and (cp.getint('global', 'pollInterval') >= 5)):
 			self.pollInterval = cp.getint('global', 'pollInterval')
 
+		self.pollJitter = 0.1
+		if(cp.has_option('global', 'pollJitter') and (0 <= cp.getfloat('global', 'pollJitter') < 1)):
+			self.pollJitter = cp.getfloat('global', 'pollJitter')
+
+		self.workers = 1
+		if(cp.has_option('global', 'workers') and (cp.getint('global', 'workers') >= 1)):
+			self.workers = cp.getint('global', 'workers')
+
 		if(cp.has_option('global', 'debug')):
 			self.debug = cp.getboolean('global', 'debug')
 		else:
 			self.debug = False
 
+		self.cacheTTL = 120
+		if(cp.has_option('global', 'cacheTTL') and (cp.getint('global', 'cacheTTL') >= 0)):
+			self.cacheTTL = cp.getint('global', 'cacheTTL')
+
+		self.cacheSize = 128
+		if(cp.has_option('global', 'cacheSize') and (cp.getint('global', 'cacheSize') >= 1)):
+			self.cacheSize = cp.getint('global', 'cacheSize')
+
+		self.extraction = cp.get('global', 'extraction') if cp.has_option('global', 'extraction') else 'bulk'
+
 		if(cp.has_option('global', 'dailyAlerts')):
 			self.dailyAlerts = cp.getboolean('global', 'dailyAlerts')
 		else:
@@ -181,6 +234,10 @@ class configuration(object):
 		else:
 			raise Exception("Unspecified notificationMethod")
 
+		self.notificationDigestWindow = 10
+		if(cp.has_option('global', 'notificationDigestWindow') and (cp.getint('global', 'notificationDigestWindow') >= 0)):
+			self.notificationDigestWindow = cp.getint('global', 'notificationDigestWindow')
+
 		if(self.notificationMethod == 'smtp'):
 			self.notification = configurationNotificationSmtp(cp)
 		elif(self.notificationMethod == 'twilio'):
@@ -202,26 +259,91 @@ class configuration(object):
 		else:
 			raise Exception("Unrecognized browser '" + self.browser + "'")
 
+		self.backend = cp.get('global', 'backend') if cp.has_option('global', 'backend') else 'selenium'
+		self.http = configurationBackendHttp(cp, self.workers)
+		self.queue = configurationQueue(cp)
+
+		self.browserProfile = cp.get('global', 'browserProfile') if cp.has_option('global', 'browserProfile') else 'standard'
+		if(self.browserProfile not in ['standard', 'lean']):
+			raise Exception("Unrecognized browserProfile '" + self.browserProfile + "'")
+
+		self.maxPageLoads = cp.getint('global', 'maxPageLoads') if cp.has_option('global', 'maxPageLoads') else 100
+		self.maxBrowserMemory = cp.getint('global', 'maxBrowserMemory') if cp.has_option('global', 'maxBrowserMemory') else 0
+		self.spareBrowsers = cp.getint('global', 'spareBrowsers') if cp.has_option('global', 'spareBrowsers') else 1
+
+		self.blockedUrls = []
+		if(cp.has_option('global', 'blockedUrls')):
+			self.blockedUrls = [x.strip() for x in cp.get('global', 'blockedUrls').split(',') if x.strip()]
+
+		self.requestRate = cp.getfloat('global', 'requestRate') if cp.has_option('global', 'requestRate') else 0.0
+		self.requestBurst = cp.getint('global', 'requestBurst') if cp.has_option('global', 'requestBurst') else self.workers
+		self.breakerThreshold = cp.getint('global', 'breakerThreshold') if cp.has_option('global', 'breakerThreshold') else 5
+		self.breakerWindow = cp.getint('global', 'breakerWindow') if cp.has_option('global', 'breakerWindow') else 600
+		self.breakerCooldown = cp.getint('global', 'breakerCooldown') if cp.has_option('global', 'breakerCooldown') else 300
+
+		self.metricsFile = cp.get('global', 'metricsFile') if cp.has_option('global', 'metricsFile') else ''
+		self.metricsLog = cp.get('global', 'metricsLog') if cp.has_option('global', 'metricsLog') else ''
+
 		if(cp.has_option('global', 'historyFileBase')):
 			self.historyFileBase = cp.get('global', 'historyFileBase')
 		else:
 			self.historyFileBase = ''
 
+		self.historyLength = 100
+		if(cp.has_option('global', 'historyLength') and (cp.getint('global', 'historyLength') >= 1)):
+			self.historyLength = cp.getint('global', 'historyLength')
+
+		self.notificationSummaryLength = 10
+		if(cp.has_option('global', 'notificationSummaryLength') and (cp.getint('global', 'notificationSummaryLength') >= 0)):
+			self.notificationSummaryLength = cp.getint('global', 'notificationSummaryLength')
+
 		if(cp.has_option('global', 'tripsDir')):
 			self.tripsDir = cp.get('global', 'tripsDir')
 		else:
 			self.tripsDir = 'trips'
 
+		self.historyStore = cp.get('global', 'historyStore') if cp.has_option('global', 'historyStore') else 'csv'
+		if(self.historyStore not in ['csv', 'delta', 'sqlite']):
+			raise Exception("Unrecognized historyStore '" + self.historyStore + "'")
+
+		self.snapshotInterval = 500
+		if(cp.has_option('global', 'snapshotInterval') and (cp.getint('global', 'snapshotInterval') >= 0)):
+			self.snapshotInterval = cp.getint('global', 'snapshotInterval')
+
+		if(cp.has_option('global', 'historyDatabase')):
+			self.historyDatabase = cp.get('global', 'historyDatabase')
+		else:
+			self.historyDatabase = self.tripsDir + '/history.db'
+
+		if(cp.has_option('global', 'stateFile')):
+			self.stateFile = cp.get('global', 'stateFile')
+		else:
+			self.stateFile = self.tripsDir + '/state.json'
+
 		i = 0
 		self.trips = []
+		self.plans = []
 		pattern = re.compile("^trip-[0-9]+$")
 		for section in cp.sections():
 			if(not pattern.match(section)):
 				continue
 
-			self.trips.append(configurationTrip(cp, section, i))
+			trip = configurationTrip(cp, section, i, self.backend)
+			if(trip.type != 'flexible'):
+				self.trips.append(trip)
+				i += 1
+				continue
 
-			i += 1
+				# Flexible trips are monitored as the distinct oneway legs that make them up
+			try:
+				plan = planner.plan(trip)
+			except ValueError as e:
+				raise Exception("For section '" + section + "', invalid flexible trip - " + str(e))
+			for leg in plan.legs:
+				leg.index = i
+				self.trips.append(leg)
+				i += 1
+			self.plans.append(plan)
 
 		if(len(self.trips) == 0):
 			raise Exception("Configuration file must have at least one [trip-X] section")
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+def parseSpecificFlights(specificFlights):
+    return set([x.strip() for x in specificFlights.split(',') if x.strip()])
+
+class fareTracker(object):
+    """
+    Keeps the running fare state for a trip in memory, updated from each scrape:
+        - the last fare seen for every flight
+        - the lowest qualifying fare (and flight) for each leg of the latest scrape
+    Flights qualify if they are one of specificFlights (if set, all other rules do not matter),
+    otherwise they must meet all of maxStops, maxDuration and maxPrice
+    """
+
+    def __init__(self, trip):
+        self.specificFlights = parseSpecificFlights(trip.specificFlights)
+        self.maxStops = trip.maxStops
+        self.maxDuration = trip.maxDuration
+        self.maxPrice = trip.maxPrice
+        self.legs = ['depart', 'return'] if trip.type == 'roundtrip' else ['depart']
+
+        self.lastFares = {}
+        self.lowestFlights = dict((leg, None) for leg in self.legs)
+
+    def qualifies(self, flight):
+        if flight['fare'] is None:
+            return False
+
+        if self.specificFlights:
+            return flight['flight'] in self.specificFlights
+
+        return (flight['stops'] <= self.maxStops) and \
+            ((not self.maxDuration) or (flight['duration'] <= self.maxDuration)) and \
+            ((not self.maxPrice) or (flight['fare'] <= self.maxPrice))
+
+    def update(self, departFlights, returnFlights, lowestFlights = None):
+        """
+        Updates state from a scrape, returning a list of (leg, flight, oldFare, newFare) for
+        every flight whose fare changed since the previous scrape. lowestFlights ({leg: flight})
+        are the lowest qualifying flights if they were already found by a batchEvaluator
+        """
+        changes = []
+
+        for leg, flights in zip(self.legs, [departFlights, returnFlights]):
+            lowestFlight = None
+            for flight in flights:
+                key = (leg, flight['flight'])
+                if (key in self.lastFares) and (self.lastFares[key] != flight['fare']):
+                    changes.append((leg, flight['flight'], self.lastFares[key], flight['fare']))
+                self.lastFares[key] = flight['fare']
+
+                if (lowestFlights is None) and self.qualifies(flight) and ((lowestFlight is None) or (flight['fare'] < lowestFlight['fare'])):
+                    lowestFlight = flight
+
+            self.lowestFlights[leg] = lowestFlight if lowestFlights is None else lowestFlights.get(leg)
+
+        return changes
+
+    def checkpoint(self):
+        return {
+            'lastFares': [[leg, flight, fare] for (leg, flight), fare in self.lastFares.items()],
+            'lowestFlights': self.lowestFlights
+        }
+
+    def restore(self, saved):
+        self.lastFares = dict(((leg, flight), fare) for leg, flight, fare in saved['lastFares'])
+        for leg in self.legs:
+            self.lowestFlights[leg] = saved['lowestFlights'].get(leg)
+
+    def lowestFare(self, leg = None):
+        """
+        Returns the lowest qualifying fare for a leg, or for the whole trip (sum of legs) if leg
+        isn't specified. None if there isn't a qualifying fare
+        """
+        legs = [leg] if leg else self.legs
+        if any(self.lowestFlights[x] is None for x in legs):
+            return None
+        return sum(self.lowestFlights[x]['fare'] for x in legs)
+
+    def describe(self):
+        return ", ".join(leg + " #" + self.lowestFlights[leg]['flight'] + " $" + str(self.lowestFlights[leg]['fare'])
+            for leg in self.legs if self.lowestFlights[leg])
+
+LEGS = ['depart', 'return']
+
+class batchEvaluator(object):
+    """
+    Applies the filtering rules of many trips at once. The rules are turned into arrays indexed by
+    trip position when created, and evaluate() takes the scrape results of a batch of trips as a
+    single columnar table, so every trip's rules are applied with a handful of array operations
+    rather than a loop per trip. The results are the same as fareTracker.qualifies()
+    """
+
+    def __init__(self, trips):
+        self.trips = list(trips)
+        self.positions = dict((trip.index, position) for position, trip in enumerate(self.trips))
+
+        # A value of 0 for maxDuration or maxPrice means there isn't a limit
+        self.maxStops = np.array([trip.maxStops for trip in self.trips], dtype=np.int16)
+        self.maxDuration = np.array([trip.maxDuration or np.inf for trip in self.trips], dtype=np.float64)
+        self.maxPrice = np.array([trip.maxPrice or np.inf for trip in self.trips], dtype=np.float32)
+        self.hasSpecificFlights = np.array([bool(parseSpecificFlights(trip.specificFlights)) for trip in self.trips])
+        self.specificFlights = pd.MultiIndex.from_tuples(
+            [(position, flight) for position, trip in enumerate(self.trips) for flight in parseSpecificFlights(trip.specificFlights)],
+            names=['position', 'flight'])
+
+    def table(self, results):
+        """
+        Builds the columnar table for a batch from {trip.index: (departFlights, returnFlights)}, with
+        the position of each flight in its leg's list (offset) so it can be found again
+        """
+        rows = []
+        for index, (departFlights, returnFlights) in results.items():
+            position = self.positions[index]
+            for leg, flights in enumerate([departFlights, returnFlights]):
+                rows += [(position, leg, offset, f['flight'], f['stops'], f['duration'], f['fare']) for offset, f in enumerate(flights)]
+
+        table = pd.DataFrame.from_records(rows, columns=['position', 'leg', 'offset', 'flight', 'stops', 'duration', 'fare'])
+        return table.astype({
+            'position': np.int32,
+            'leg': np.int8,
+            'offset': np.int32,
+            'flight': 'category',
+            'stops': np.int16,
+            # Durations are compared exactly as fareTracker does, so aren't narrowed to float32
+            'duration': np.float64,
+            'fare': np.float32 # Missing (sold out/unavailable) fares become NaN and never qualify
+        })
+
+    def evaluate(self, results):
+        """
+        Returns {trip.index: {leg: lowest qualifying flight, or None}} for the scrape results of a batch
+        ({trip.index: (departFlights, returnFlights)}). Like fareTracker, ties go to the first flight listed
+        """
+        table = self.table(results)
+        position = table['position'].to_numpy()
+        leg = table['leg'].to_numpy()
+        fare = table['fare'].to_numpy()
+
+        specificMatch = pd.MultiIndex.from_arrays([table['position'], table['flight'].astype(object)]).isin(self.specificFlights)
+        ruleMatch = (table['stops'].to_numpy() <= self.maxStops[position]) & \
+            (table['duration'].to_numpy() <= self.maxDuration[position]) & \
+            (fare <= self.maxPrice[position])
+        mask = ~np.isnan(fare) & np.where(self.hasSpecificFlights[position], specificMatch, ruleMatch)
+
+        # Sorted by trip and leg, then fare, then table order, so the first row of each trip and leg is its lowest
+        rows = np.flatnonzero(mask)
+        group = position[rows].astype(np.int64) * 2 + leg[rows]
+        order = np.lexsort((rows, fare[rows], group))
+        groups, first = np.unique(group[order], return_index=True)
+        lowestRows = rows[order][first]
+
+        lowest = dict((index, dict((LEGS[x], None) for x in range(2))) for index in results)
+        offsets = table['offset'].to_numpy()
+        for group, row in zip(groups.tolist(), lowestRows.tolist()):
+            trip = self.trips[group // 2]
+            lowest[trip.index][LEGS[group % 2]] = results[trip.index][group % 2][offsets[row]]
+        return lowest
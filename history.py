@@ -0,0 +1,443 @@
+import os
+import csv
+import json
+import collections
+
+COLUMNS = ['query_datetime', 'returnOrDepart', 'flight', 'departTime', 'arriveTime', 'duration', 'stops', 'fare', 'fareAnytime', 'fareBusinessSelect']
+
+def tripName(trip):
+    return trip if isinstance(trip, str) else trip.description.split('/')[-1]
+
+def tripConfig(trip):
+    return {
+        'adultPassengersCount': trip.adultPassengersCount,
+        'departureDate': trip.departureDate,
+        'departureTimeOfDay': trip.departureTimeOfDay,
+        'description': trip.description,
+        'destinationAirportCode': trip.destinationAirportCode,
+        'maxDuration': trip.maxDuration,
+        'maxPrice': trip.maxPrice,
+        'maxStops': trip.maxStops,
+        'originationAirportCode': trip.originationAirportCode,
+        'returnDate': trip.returnDate,
+        'returnTimeOfDay': trip.returnTimeOfDay,
+        'specificFlights': trip.specificFlights,
+        'type': trip.type,
+    }
+
+def flightRows(queryDatetime, departFlights, returnFlights):
+    rows = []
+    for returnOrDepart, flights in (('depart', departFlights), ('return', returnFlights)):
+        for flight in flights:
+            row = dict(flight)
+            row['query_datetime'] = queryDatetime
+            row['returnOrDepart'] = returnOrDepart
+            rows.append(row)
+    return rows
+
+def writeAtomic(fileName, text):
+    # Write to a temporary file first, so a crash never leaves a partially written file behind
+    tempFileName = fileName + '.tmp'
+    with open(tempFileName, 'w', newline='') as tempFile:
+        tempFile.write(text)
+        tempFile.flush()
+        os.fsync(tempFile.fileno())
+    os.replace(tempFileName, fileName)
+
+def repairTail(fileName):
+    # If a previous append was interrupted, the file won't end with a newline. Drop the
+    # partial row so the next append starts on a clean line. Only the tail is read, so
+    # this costs the same no matter how large the history is
+    with open(fileName, 'rb+') as historyFile:
+        historyFile.seek(0, os.SEEK_END)
+        size = historyFile.tell()
+        if size == 0:
+            return
+        historyFile.seek(size - 1)
+        if historyFile.read(1) == b'\n':
+            return
+
+        position = size
+        while position > 0:
+            blockStart = max(0, position - 65536)
+            historyFile.seek(blockStart)
+            block = historyFile.read(position - blockStart)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                historyFile.truncate(blockStart + newline + 1)
+                return
+            position = blockStart
+        historyFile.truncate(0)
+
+def parseRow(row):
+    # Converts a row read back from CSV to the types a scrape produces. CSV history written through
+    # pandas stores fares as floats (129.0) and missing ones as empty strings
+    row['duration'] = float(row['duration']) if row['duration'] else None
+    for key in ['stops', 'fare', 'fareAnytime', 'fareBusinessSelect']:
+        row[key] = parseOptionalInt(row[key])
+    return row
+
+def tailLines(fileName, count, blockSize = 65536):
+    """
+    Returns the last count lines of a file (oldest first, without line endings), reading backwards
+    from the end in blocks so the cost depends on count rather than the size of the file
+    """
+    with open(fileName, 'rb') as tailFile:
+        tailFile.seek(0, os.SEEK_END)
+        position = tailFile.tell()
+        data = b''
+        while (position > 0) and (data.count(b'\n') <= count):
+            blockStart = max(0, position - blockSize)
+            tailFile.seek(blockStart)
+            data = tailFile.read(position - blockStart) + data
+            position = blockStart
+
+    lines = [line.rstrip('\r') for line in data.decode('utf-8', errors='replace').split('\n')]
+    if lines and lines[-1] == '':
+        lines.pop()
+    if position > 0:
+        # The first line is probably only part of a line
+        lines = lines[1:]
+    return lines[-count:] if count else []
+
+class csvHistory(object):
+    """
+    Flight history stored as one CSV file per trip (plus a _config.json describing the trip).
+    New rows are only ever appended, so the cost of each scrape doesn't grow with the history.
+    """
+
+    def __init__(self, tripsDir):
+        self.tripsDir = tripsDir
+
+    def fileName(self, trip):
+        return os.path.join(self.tripsDir, f"{tripName(trip)}.csv")
+
+    def initialize(self, trip):
+        fileName = self.fileName(trip)
+        if os.path.exists(fileName):
+            # File exists so it's already initialized
+            return
+        os.makedirs(self.tripsDir, exist_ok=True)
+        writeAtomic(os.path.join(self.tripsDir, f'{tripName(trip)}_config.json'), json.dumps(tripConfig(trip), indent=2))
+        writeAtomic(fileName, ','.join(COLUMNS) + '\n')
+
+    def append(self, trip, queryDatetime, departFlights, returnFlights):
+        fileName = self.fileName(trip)
+        repairTail(fileName)
+
+        with open(fileName, 'a', newline='') as historyFile:
+            writer = csv.DictWriter(historyFile, fieldnames=COLUMNS, extrasaction='ignore', lineterminator='\n')
+            writer.writerows(flightRows(queryDatetime, departFlights, returnFlights))
+            historyFile.flush()
+            os.fsync(historyFile.fileno())
+
+DELTA_COLUMNS = COLUMNS + ['change']
+DELTA_SUFFIX = '.delta.csv'
+
+class deltaHistory(csvHistory):
+    """
+    Flight history stored as one CSV file per trip, where a full snapshot of the flights is only
+    written every snapshotInterval scrapes (or when flights appear or disappear). In between, only
+    flights whose details changed since the previous scrape are written. Use reconstruct() to get
+    the flights as they were at any query_datetime.
+    """
+
+    def __init__(self, tripsDir, snapshotInterval = 500):
+        csvHistory.__init__(self, tripsDir)
+        self.snapshotInterval = snapshotInterval
+        self.lastFlights = {}
+        self.scrapesSinceSnapshot = {}
+
+    def fileName(self, trip):
+        return os.path.join(self.tripsDir, tripName(trip) + DELTA_SUFFIX)
+
+    def initialize(self, trip):
+        fileName = self.fileName(trip)
+        if os.path.exists(fileName):
+            return
+        os.makedirs(self.tripsDir, exist_ok=True)
+        writeAtomic(os.path.join(self.tripsDir, f'{tripName(trip)}_config.json'), json.dumps(tripConfig(trip), indent=2))
+        writeAtomic(fileName, ','.join(DELTA_COLUMNS) + '\n')
+
+    def append(self, trip, queryDatetime, departFlights, returnFlights):
+        name = tripName(trip)
+        rows = flightRows(queryDatetime, departFlights, returnFlights)
+        flights = collections.OrderedDict(((row['returnOrDepart'], row['flight']), row) for row in rows)
+        lastFlights = self.lastFlights.get(name)
+
+            # Always start with a snapshot after a restart, since the previous flights aren't known. Flights
+            # appearing or disappearing also get a snapshot, so flight order is reconstructed exactly
+        if (lastFlights is None) or (list(lastFlights) != list(flights)) or (self.scrapesSinceSnapshot[name] >= self.snapshotInterval):
+            for row in rows:
+                row['change'] = 'snapshot'
+            if not rows:
+                rows = [{'query_datetime': queryDatetime, 'change': 'empty'}]
+            self.scrapesSinceSnapshot[name] = 0
+        else:
+            rows = [row for key, row in flights.items()
+                if any(row.get(column) != lastFlights[key].get(column) for column in COLUMNS[2:])]
+            for row in rows:
+                row['change'] = 'changed'
+            self.scrapesSinceSnapshot[name] += 1
+
+        self.lastFlights[name] = flights
+
+        if not rows:
+            return
+
+        fileName = self.fileName(trip)
+        repairTail(fileName)
+        with open(fileName, 'a', newline='') as historyFile:
+            writer = csv.DictWriter(historyFile, fieldnames=DELTA_COLUMNS, extrasaction='ignore', lineterminator='\n')
+            writer.writerows(rows)
+            historyFile.flush()
+            os.fsync(historyFile.fileno())
+
+    def iterate(self, trip):
+        """
+        Yields (query_datetime, departFlights, returnFlights) for every scrape where flights changed
+        """
+        flights = collections.OrderedDict()
+        queryDatetime, snapshot = None, False
+
+        with open(self.fileName(trip), newline='') as historyFile:
+            for row in csv.DictReader(historyFile):
+                if row['query_datetime'] != queryDatetime:
+                    if queryDatetime is not None:
+                        yield queryDatetime, *self.splitLegs(flights)
+                    queryDatetime, snapshot = row['query_datetime'], False
+
+                change = row.pop('change')
+                if (change in ['snapshot', 'empty']) and not snapshot:
+                    flights, snapshot = collections.OrderedDict(), True
+                if change != 'empty':
+                    flights[(row['returnOrDepart'], row['flight'])] = parseRow(row)
+
+        if queryDatetime is not None:
+            yield queryDatetime, *self.splitLegs(flights)
+
+    def splitLegs(self, flights):
+        departFlights, returnFlights = [], []
+        for (returnOrDepart, flight), row in flights.items():
+            flightDetails = {key: row[key] for key in COLUMNS[2:]}
+            (departFlights if returnOrDepart == 'depart' else returnFlights).append(flightDetails)
+        return departFlights, returnFlights
+
+    def reconstruct(self, trip, queryDatetime):
+        """
+        Returns (departFlights, returnFlights) as they were at queryDatetime, or None if
+        queryDatetime is before the first recorded scrape
+        """
+        queryDatetime = formatQueryDatetime(queryDatetime)
+        result = None
+        for changeDatetime, departFlights, returnFlights in self.iterate(trip):
+            if changeDatetime > queryDatetime:
+                break
+            result = departFlights, returnFlights
+        return result
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    trip_id INTEGER NOT NULL REFERENCES trips(id),
+    query_datetime TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_trip_datetime ON runs (trip_id, query_datetime);
+CREATE TABLE IF NOT EXISTS observations (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    trip_id INTEGER NOT NULL REFERENCES trips(id),
+    query_datetime TEXT NOT NULL,
+    returnOrDepart TEXT NOT NULL,
+    flight TEXT NOT NULL,
+    departTime TEXT,
+    arriveTime TEXT,
+    duration REAL,
+    stops INTEGER,
+    fare INTEGER,
+    fareAnytime INTEGER,
+    fareBusinessSelect INTEGER
+);
+CREATE INDEX IF NOT EXISTS observations_trip_datetime ON observations (trip_id, query_datetime);
+CREATE INDEX IF NOT EXISTS observations_trip_flight ON observations (trip_id, flight, query_datetime);
+"""
+
+def parseOptionalInt(value):
+    if value is None or value == '' or value != value:
+        return None
+    return int(float(value))
+
+def formatQueryDatetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if hasattr(value, 'strftime') else value
+
+class sqliteHistory(object):
+    """
+    Flight history stored in a SQLite database, with trips, scrape runs, and flight observations
+    indexed by (trip, query_datetime) and (trip, flight) so queries don't scan the whole history.
+    """
+
+    def __init__(self, databaseFile):
+        import sqlite3
+        import threading
+
+        directory = os.path.dirname(databaseFile)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(databaseFile, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SQLITE_SCHEMA)
+        self.tripIds = {}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def tripId(self, trip, config = None):
+        name = tripName(trip)
+        if name in self.tripIds:
+            return self.tripIds[name]
+
+        with self.lock:
+            row = self.connection.execute("SELECT id FROM trips WHERE name = ?", (name,)).fetchone()
+            if row:
+                self.tripIds[name] = row['id']
+            elif config is not None:
+                with self.connection:
+                    cursor = self.connection.execute("INSERT INTO trips (name, config) VALUES (?, ?)", (name, json.dumps(config)))
+                self.tripIds[name] = cursor.lastrowid
+            else:
+                raise KeyError("Trip '" + name + "' has no history")
+
+        return self.tripIds[name]
+
+    def initialize(self, trip):
+        self.tripId(trip, tripConfig(trip))
+
+    def append(self, trip, queryDatetime, departFlights, returnFlights):
+        self.insertRun(self.tripId(trip, tripConfig(trip)), queryDatetime, flightRows(queryDatetime, departFlights, returnFlights))
+
+    def insertRun(self, tripId, queryDatetime, rows):
+        with self.lock, self.connection:
+            # One transaction per scrape, so all of its rows are written with a single commit
+            runId = self.connection.execute("INSERT INTO runs (trip_id, query_datetime) VALUES (?, ?)", (tripId, queryDatetime)).lastrowid
+            self.connection.executemany(
+                "INSERT INTO observations (run_id, trip_id, query_datetime, returnOrDepart, flight, departTime, arriveTime, duration, stops, fare, fareAnytime, fareBusinessSelect) " \
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(runId, tripId, queryDatetime, row['returnOrDepart'], row['flight'], row.get('departTime'), row.get('arriveTime'),
+                    row.get('duration'), row.get('stops'), row.get('fare'), row.get('fareAnytime'), row.get('fareBusinessSelect')) for row in rows])
+        return runId
+
+    def query(self, sql, parameters):
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, parameters).fetchall()]
+
+    def filter(self, trip, flight, returnOrDepart, since, until):
+        sql = " WHERE trip_id = ?"
+        parameters = [self.tripId(trip)]
+        if flight is not None:
+            sql += " AND flight = ?"
+            parameters.append(flight)
+        if since is not None:
+            sql += " AND query_datetime >= ?"
+            parameters.append(formatQueryDatetime(since))
+        if until is not None:
+            sql += " AND query_datetime <= ?"
+            parameters.append(formatQueryDatetime(until))
+        if returnOrDepart is not None:
+            sql += " AND returnOrDepart = ?"
+            parameters.append(returnOrDepart)
+        return sql, parameters
+
+    def observations(self, trip, flight = None, returnOrDepart = None, since = None, until = None):
+        """
+        Returns flight observations for a trip, oldest first, optionally restricted to a flight
+        number, a leg ('depart' or 'return'), and a query_datetime range
+        """
+        sql, parameters = self.filter(trip, flight, returnOrDepart, since, until)
+        return self.query("SELECT " + ', '.join(COLUMNS) + " FROM observations" + sql + " ORDER BY query_datetime", parameters)
+
+    def lowestFare(self, trip, flight = None, returnOrDepart = None, since = None, until = None):
+        """
+        Returns the observation with the lowest fare (eg: lowest fare for flight 1234 over the last
+        7 days), or None if there aren't any available fares
+        """
+        sql, parameters = self.filter(trip, flight, returnOrDepart, since, until)
+        rows = self.query("SELECT " + ', '.join(COLUMNS) + " FROM observations" + sql + " AND fare IS NOT NULL ORDER BY fare, query_datetime LIMIT 1", parameters)
+        return rows[0] if rows else None
+
+    def runs(self, trip, since = None):
+        sql = "SELECT query_datetime FROM runs WHERE trip_id = ?"
+        parameters = [self.tripId(trip)]
+        if since is not None:
+            sql += " AND query_datetime >= ?"
+            parameters.append(formatQueryDatetime(since))
+        return [row['query_datetime'] for row in self.query(sql + " ORDER BY query_datetime", parameters)]
+
+    def latestFlights(self, trip):
+        """Returns the flights seen by the most recent scrape of a trip"""
+        tripId = self.tripId(trip)
+        return self.query("SELECT " + ', '.join(COLUMNS) + " FROM observations " \
+            "WHERE trip_id = ? AND query_datetime = (SELECT MAX(query_datetime) FROM runs WHERE trip_id = ?)", (tripId, tripId))
+
+    def importCsv(self, fileName):
+        """
+        Imports a trip CSV (and its _config.json, if present) written by csvHistory. Only scrapes newer
+        than what is already in the database are imported, so this can safely be run more than once
+        """
+        name = os.path.splitext(os.path.basename(fileName))[0]
+        config = None
+        configFileName = os.path.join(os.path.dirname(fileName), name + '_config.json')
+        if os.path.exists(configFileName):
+            with open(configFileName) as configFile:
+                config = json.load(configFile)
+        tripId = self.tripId(name, config or {})
+
+        latest = self.query("SELECT MAX(query_datetime) AS latest FROM runs WHERE trip_id = ?", (tripId,))[0]['latest']
+
+        imported = 0
+        runDatetime, runRows = None, []
+        with open(fileName, newline='') as historyFile:
+            for row in csv.DictReader(historyFile):
+                if latest and row['query_datetime'] <= latest:
+                    continue
+                if row['query_datetime'] != runDatetime:
+                    if runRows:
+                        self.insertRun(tripId, runDatetime, runRows)
+                        imported += 1
+                    runDatetime, runRows = row['query_datetime'], []
+                runRows.append(parseRow(row))
+        if runRows:
+            self.insertRun(tripId, runDatetime, runRows)
+            imported += 1
+
+        return imported
+
+def migrate(tripsDir, databaseFile):
+    import glob
+
+    store = sqliteHistory(databaseFile)
+    try:
+        for fileName in sorted(glob.glob(os.path.join(tripsDir, '*.csv'))):
+            if fileName.endswith(DELTA_SUFFIX):
+                continue
+            print(fileName + ": imported " + str(store.importCsv(fileName)) + " scrapes")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "history.py: Import existing trip CSV history into a SQLite database")
+    parser.add_argument('-t', '--tripsDir', dest = 'tripsDir', default = 'trips', help = "Directory containing trip CSV files")
+    parser.add_argument('-d', '--database', dest = 'databaseFile', default = os.path.join('trips', 'history.db'), help = "SQLite database to import into")
+    args = parser.parse_args()
+
+    migrate(args.tripsDir, args.databaseFile)
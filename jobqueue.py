@@ -0,0 +1,184 @@
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+
+import swa
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    query_key TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    query TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error_type TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    completed_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state_available ON jobs (state, available_at);
+CREATE INDEX IF NOT EXISTS jobs_query_key ON jobs (query_key, state);
+"""
+
+# Scrape errors which are answers rather than failures (retrying them won't help), so they're passed
+# back to the coordinator to be handled exactly as if the scrape had run locally
+RESULT_ERRORS = ['scrapeValidation', 'scrapeDatePast', 'scrapeTimeout', 'scrapeDatesNotOpen']
+
+class jobWaitTimeout(Exception):
+    """No worker finished a job in time, which says nothing about SWA (the workers may just be busy)"""
+    pass
+
+# Finished jobs are kept this long (in seconds), so everyone waiting on one can read its result
+RETENTION = 3600
+
+def workerName():
+    return socket.gethostname() + ':' + uuid.uuid4().hex[:8]
+
+class jobQueue(object):
+    """
+    Durable queue of scrape jobs in a SQLite database, shared by a coordinator (which submits jobs
+    for due trips and waits for their results) and any number of worker processes (which claim,
+    scrape and complete them), on this or other hosts that can lock the same database file.
+
+    Workers claim a job with a lease of leaseTime seconds. If a worker dies or hangs, its lease
+    expires and the job is claimed again by another worker, up to maxAttempts claims. A job
+    is only completed by the worker currently holding its lease, and the coordinator reuses the
+    outstanding job for a query rather than submitting another, so each query is scraped once
+    """
+
+    def __init__(self, databaseFile, leaseTime = 300, maxAttempts = 3):
+        self.databaseFile = databaseFile
+        self.leaseTime = leaseTime
+        self.maxAttempts = maxAttempts
+        # A connection per thread, as the coordinator waits on jobs from several threads
+        self.local = threading.local()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        if getattr(self.local, 'connection', None) is None:
+            # Rollback journal rather than WAL, as WAL doesn't work when hosts share the file
+            self.local.connection = sqlite3.connect(self.databaseFile, timeout = 30, isolation_level = None)
+        return self.local.connection
+
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't claim the same job
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        return connection
+
+    def submit(self, backend, query):
+        """Returns the id of the outstanding job for this query, submitting one if there isn't one"""
+        queryKey = backend + ':' + json.dumps(query, sort_keys = True)
+        connection = self.transaction()
+        try:
+            connection.execute("DELETE FROM jobs WHERE state IN ('done', 'failed') AND completed_at < ?", (time.time() - RETENTION,))
+            row = connection.execute("SELECT id FROM jobs WHERE query_key = ? AND state IN ('pending', 'leased')", (queryKey,)).fetchone()
+            if row:
+                jobId = row[0]
+            else:
+                now = time.time()
+                jobId = connection.execute("INSERT INTO jobs (query_key, backend, query, state, available_at, created_at) VALUES (?, ?, ?, 'pending', ?, ?)",
+                    (queryKey, backend, json.dumps(query), now, now)).lastrowid
+            connection.execute("COMMIT")
+        except:
+            connection.execute("ROLLBACK")
+            raise
+        return jobId
+
+    def claim(self, owner, backends = ['selenium', 'http']):
+        """
+        Leases the oldest available job (pending, or leased by a worker whose lease expired) for one
+        of backends, returning (jobId, backend, query) or None if there isn't one
+        """
+        now = time.time()
+        placeholders = ','.join('?' * len(backends))
+        connection = self.transaction()
+        try:
+            # Jobs whose lease expired on their last allowed attempt have failed
+            connection.execute("UPDATE jobs SET state = 'failed', error = 'Lease expired ' || attempts || ' times', completed_at = ? "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, now, self.maxAttempts))
+            row = connection.execute("SELECT id, backend, query FROM jobs WHERE backend IN (" + placeholders + ") AND "
+                "((state = 'pending' AND available_at <= ?) OR (state = 'leased' AND lease_expires < ?)) "
+                "ORDER BY available_at, id LIMIT 1", list(backends) + [now, now]).fetchone()
+            if row:
+                connection.execute("UPDATE jobs SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    (owner, now + self.leaseTime, row[0]))
+            connection.execute("COMMIT")
+        except:
+            connection.execute("ROLLBACK")
+            raise
+
+        if not row:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def finish(self, jobId, owner, assignments, values):
+        connection = self.transaction()
+        try:
+            updated = connection.execute("UPDATE jobs SET " + assignments + " WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+                list(values) + [jobId, owner]).rowcount
+            connection.execute("COMMIT")
+        except:
+            connection.execute("ROLLBACK")
+            raise
+        # False if the lease expired and the job went to another worker, whose result will be used
+        return updated == 1
+
+    def complete(self, jobId, owner, departFlights, returnFlights):
+        return self.finish(jobId, owner, "state = 'done', result = ?, error_type = NULL, error = NULL, completed_at = ?",
+            (json.dumps([departFlights, returnFlights]), time.time()))
+
+    def fail(self, jobId, owner, error):
+        """Records a failed scrape: errors in RESULT_ERRORS are returned as is, others are retried"""
+        errorType = type(error).__name__
+        if errorType in RESULT_ERRORS:
+            return self.finish(jobId, owner, "state = 'done', error_type = ?, error = ?, completed_at = ?",
+                (errorType, str(error), time.time()))
+
+        # Retried after a delay by releasing the lease, unless that was the last attempt
+        return self.finish(jobId, owner,
+            "state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, available_at = ? + 30 * attempts, "
+            "lease_owner = NULL, lease_expires = NULL, error_type = ?, error = ?, completed_at = ?",
+            (self.maxAttempts, time.time(), errorType, str(error), time.time()))
+
+    def result(self, jobId):
+        """
+        Returns (departFlights, returnFlights) of a finished job, raising the scrape error it finished
+        with. Returns None while the job is still outstanding
+        """
+        connection = self.connection()
+        row = connection.execute("SELECT state, result, error_type, error FROM jobs WHERE id = ?", (jobId,)).fetchone()
+        if row is None:
+            raise swa.scrapeGeneral("Job " + str(jobId) + " is no longer in the queue")
+        state, result, errorType, error = row
+        if state in ['pending', 'leased']:
+            return None
+
+        if state == 'failed':
+            raise swa.scrapeGeneral(error)
+        if errorType:
+            raise getattr(swa, errorType)(error)
+        departFlights, returnFlights = json.loads(result)
+        return departFlights, returnFlights
+
+    def wait(self, jobId, timeout, interval = 1.0):
+        deadline = time.time() + timeout
+        while True:
+            result = self.result(jobId)
+            if result is not None:
+                return result
+            if time.time() >= deadline:
+                # Left in the queue, so the next submit for the query picks it up rather than adding another
+                raise jobWaitTimeout("No worker finished job " + str(jobId) + " within " + str(timeout) + " seconds")
+            time.sleep(interval)
+
+    def counts(self):
+        return dict(self.connection().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
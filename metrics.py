@@ -0,0 +1,115 @@
+import os
+import time
+import json
+import threading
+import contextlib
+
+def labelText(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join([key + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"' for key, value in labels]) + '}'
+
+class registry(object):
+    """
+    Collects timing spans for each phase of a scrape, counters and gauges, labelled by trip. They
+    can be written as a Prometheus textfile (for node_exporter's textfile collector), and/or each
+    scrape can be logged as a line of JSON. When neither is configured, recording does nothing
+    """
+
+    def __init__(self, prometheusFile = '', logFile = ''):
+        self.prometheusFile = prometheusFile
+        self.logFile = logFile
+        self.enabled = bool(prometheusFile or logFile)
+        self.lock = threading.Lock()
+        # Workers and the notifier export concurrently, so writing the file is serialized
+        self.exportLock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def key(self, name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def observe(self, phase, seconds, **labels):
+        if not self.enabled:
+            return
+        key = self.key(phase, labels)
+        with self.lock:
+            total, count = self.spans.get(key, (0.0, 0))
+            self.spans[key] = (total + seconds, count + 1)
+
+    @contextlib.contextmanager
+    def span(self, phase, timings = None, **labels):
+        """Times the enclosed block as phase, also adding it to timings (a dict) if given"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            if timings is not None:
+                timings[phase] = timings.get(phase, 0) + seconds
+            self.observe(phase, seconds, **labels)
+
+    def count(self, name, amount = 1, **labels):
+        if not self.enabled:
+            return
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def total(self, name, value, **labels):
+        """Sets a counter to a running total kept elsewhere (eg: swa.statistics)"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[self.key(name, labels)] = value
+
+    def gauge(self, name, value, **labels):
+        if (not self.enabled) or (value is None):
+            return
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def log(self, record):
+        if not self.logFile:
+            return
+        line = json.dumps(record) + '\n'
+        try:
+            with self.lock:
+                with open(self.logFile, 'a') as logFile:
+                    logFile.write(line)
+        except (IOError, OSError) as e:
+            # Metrics must never stop a scrape
+            print("Unable to write metrics log '" + self.logFile + "': " + str(e))
+
+    def prometheusText(self):
+        lines = []
+        with self.lock:
+            lines.append("# TYPE swatcher_phase_seconds summary")
+            for (phase, labels), (total, count) in sorted(self.spans.items()):
+                lines.append("swatcher_phase_seconds_sum" + labelText((('phase', phase),) + labels) + " " + repr(total))
+                lines.append("swatcher_phase_seconds_count" + labelText((('phase', phase),) + labels) + " " + str(count))
+            for name in sorted(set(name for name, labels in self.counters)):
+                lines.append("# TYPE swatcher_" + name + "_total counter")
+                lines += ["swatcher_" + name + "_total" + labelText(labels) + " " + str(value)
+                    for (counterName, labels), value in sorted(self.counters.items()) if counterName == name]
+            for name in sorted(set(name for name, labels in self.gauges)):
+                lines.append("# TYPE swatcher_" + name + " gauge")
+                lines += ["swatcher_" + name + labelText(labels) + " " + str(value)
+                    for (gaugeName, labels), value in sorted(self.gauges.items()) if gaugeName == name]
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        if not self.prometheusFile:
+            return
+        # Written to a temporary file and renamed, so the collector never reads a partial file
+        tempFileName = self.prometheusFile + '.' + str(os.getpid()) + '.tmp'
+        try:
+            text = self.prometheusText()
+            with self.exportLock:
+                with open(tempFileName, 'w') as tempFile:
+                    tempFile.write(text)
+                os.replace(tempFileName, self.prometheusFile)
+        except (IOError, OSError) as e:
+            # Metrics must never stop a scrape
+            print("Unable to export metrics to '" + self.prometheusFile + "': " + str(e))
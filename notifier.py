@@ -0,0 +1,158 @@
+import time
+import queue
+import datetime
+import threading
+
+def now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+class smtpTransport(object):
+    """
+    Sends mail over a single SMTP connection kept open between notifications. The connection is
+    checked before use and re-established (including STARTTLS/login) if the server dropped it
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.server = None
+
+    def connect(self):
+            # importing this way keeps people who aren't interested in smtplib from installing it..
+        smtplib = __import__('smtplib')
+        server = smtplib.SMTP(self.config.host, self.config.port)
+        if self.config.useAuth:
+            server.ehlo()
+            server.starttls()
+            server.login(self.config.username, self.config.password)
+        return server
+
+    def connected(self):
+        try:
+            return (self.server is not None) and (self.server.noop()[0] == 250)
+        except Exception:
+            return False
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    def send(self, subject, body, summary):
+        mailMessage = """From: %s\nTo: %s\nX-Priority: 2\nSubject: %s\n\n""" % (self.config.sender, self.config.recipient, subject)
+        mailMessage += body
+        recipients = [x.strip() for x in self.config.recipient.split(',')]
+
+        for attempt in range(2):
+            if not self.connected():
+                self.close()
+                self.server = self.connect()
+            try:
+                self.server.sendmail(self.config.sender, recipients, mailMessage)
+                return
+            except Exception:
+                # The server may have closed the connection between the check and the send, so retry once on a new one
+                self.close()
+                if attempt:
+                    raise
+
+class twilioTransport(object):
+
+    def __init__(self, config):
+        self.config = config
+        self.client = None
+
+    def close(self):
+        pass
+
+    def send(self, subject, body, summary):
+        if self.client is None:
+                # importing this way keeps people who aren't interested in Twilio from installing it..
+            twilio = __import__('twilio.rest')
+            self.client = twilio.rest.Client(self.config.accountSid, self.config.authToken)
+
+        # SMS only carries the subject(s), not the history
+        self.client.messages.create(to = self.config.recipient, from_ = self.config.sender, body = summary)
+
+class dispatcher(object):
+    """
+    Delivers notifications from a background thread, so scraping never waits on a mail relay or
+    Twilio. Notifications queued within digestWindow seconds of each other are sent together as
+    one digest message
+    """
+
+    def __init__(self, config, digestWindow = 10, metrics = None):
+        self.digestWindow = digestWindow
+        self.metrics = metrics
+        self.queue = queue.Queue()
+        self.thread = None
+
+        if config.type == 'smtp':
+            self.transport = smtpTransport(config)
+        elif config.type == 'twilio':
+            self.transport = twilioTransport(config)
+        else:
+            self.transport = None
+
+    def start(self):
+        if self.transport is not None:
+            self.thread = threading.Thread(target = self.run, name = 'notifier', daemon = True)
+            self.thread.start()
+
+    def stop(self):
+        """Sends anything still queued, then closes the connection"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def notify(self, subject, body):
+        if self.transport is not None:
+            self.queue.put((subject, body))
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            event = self.queue.get()
+            if event is None:
+                break
+
+            events = [event]
+            deadline = time.time() + self.digestWindow
+            while True:
+                try:
+                    event = self.queue.get(timeout = max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                events.append(event)
+
+            self.deliver(events)
+
+        self.transport.close()
+
+    def deliver(self, events):
+        summary = '\n'.join([e[0] for e in events])
+        if len(events) == 1:
+            subject, body = events[0]
+        else:
+            subject = "swatcher: " + str(len(events)) + " notifications"
+            body = summary + '\n\n' + '\n\n'.join([e[0] + '\n' + e[1] for e in events])
+
+        start = time.time()
+        try:
+            self.transport.send(subject, body, summary)
+            print(now() + ": SENDING NOTIFICATION!!! '" + subject + "'")
+            if self.metrics:
+                self.metrics.count('notifications', len(events))
+        except Exception as e:
+            print(now() + ": UNABLE TO SEND NOTIFICATION DUE TO ERROR - " + str(e))
+            if self.metrics:
+                self.metrics.count('notificationErrors', len(events))
+        if self.metrics:
+            self.metrics.observe('notification', time.time() - start)
+            self.metrics.export()
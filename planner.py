@@ -0,0 +1,113 @@
+import copy
+import datetime
+import itertools
+import pandas as pd
+
+def parseList(value):
+    return [x.strip().upper() for x in value.split(',') if x.strip()]
+
+def parseDateRange(value):
+    """
+    Parses 'YYYY-MM-DD' or an inclusive range 'YYYY-MM-DD..YYYY-MM-DD' into a list of dates
+    """
+    if '..' in value:
+        first, last = [datetime.datetime.strptime(x.strip(), "%Y-%m-%d").date() for x in value.split('..')]
+    else:
+        first = last = datetime.datetime.strptime(value.strip(), "%Y-%m-%d").date()
+
+    if last < first:
+        raise Exception("Date range '" + value + "' ends before it starts")
+
+    return [first + datetime.timedelta(days = x) for x in range((last - first).days + 1)]
+
+def parseStayLengths(value):
+    """
+    Parses stay lengths in days, either a range '3-5' or a list '3,5,7'. Empty means oneway
+    """
+    stayLengths = set()
+    for part in [x.strip() for x in value.split(',') if x.strip()]:
+        if '-' in part:
+            first, last = [int(x) for x in part.split('-')]
+            stayLengths.update(range(first, last + 1))
+        else:
+            stayLengths.add(int(part))
+    return sorted(stayLengths)
+
+class plan(object):
+    """
+    Expands a flexible trip (sets of airports, a range of departure dates and stay lengths) into the
+    distinct oneway legs that need to be scraped. Legs are shared by every combination that uses
+    them, so the number of scrapes grows with the number of distinct legs rather than combinations.
+    SWA prices each leg of a roundtrip separately, so a combination costs the sum of its legs
+    """
+
+    def __init__(self, trip, today = None):
+        today = today or datetime.datetime.now().date()
+
+        self.description = trip.description
+        self.maxPrice = trip.maxPrice
+        self.currentLowestFare = None
+        self.legsByKey = {}
+        self.combinations = []
+
+        origins = parseList(trip.originationAirportCode)
+        destinations = parseList(trip.destinationAirportCode)
+        stayLengths = parseStayLengths(trip.stayLength)
+
+        for origin, destination, departureDate in itertools.product(origins, destinations, parseDateRange(trip.departureDate)):
+            if departureDate <= today:
+                # SWA can't be scraped on (or after) the day of the flight
+                continue
+
+            outboundKey = self.addLeg(trip, origin, destination, departureDate, trip.departureTimeOfDay)
+            if not stayLengths:
+                self.combinations.append((outboundKey, None, None))
+            for stayLength in stayLengths:
+                returnKey = self.addLeg(trip, destination, origin, departureDate + datetime.timedelta(days = stayLength), trip.returnTimeOfDay)
+                self.combinations.append((outboundKey, returnKey, stayLength))
+
+        self.legs = list(self.legsByKey.values())
+        self.pending = set()
+
+    def addLeg(self, trip, origin, destination, date, timeOfDay):
+        key = (origin, destination, date.strftime("%Y-%m-%d"))
+        if key not in self.legsByKey:
+            leg = copy.copy(trip)
+            leg.description = trip.description + "_" + origin + destination + "_" + key[2]
+            leg.originationAirportCode = origin
+            leg.destinationAirportCode = destination
+            leg.type = 'oneway'
+            leg.departureDate = key[2]
+            leg.departureTimeOfDay = timeOfDay
+            leg.returnDate = ''
+            leg.stayLength = ''
+            # maxPrice applies to the whole combination, not each leg
+            leg.maxPrice = 0
+            leg.plan = self
+            self.legsByKey[key] = leg
+        return key
+
+    def matrix(self, lowestFares):
+        """
+        Returns every combination whose legs have a qualifying fare (and within maxPrice), cheapest
+        first. lowestFares maps each leg key to its lowest qualifying fare (or None)
+        """
+        rows = []
+        for outboundKey, returnKey, stayLength in self.combinations:
+            departFare = lowestFares.get(outboundKey)
+            returnFare = lowestFares.get(returnKey) if returnKey else 0
+            if (departFare is None) or (returnFare is None):
+                continue
+            rows.append((outboundKey[0], outboundKey[1], outboundKey[2], returnKey[2] if returnKey else '', stayLength,
+                departFare, returnFare, departFare + returnFare))
+
+        matrix = pd.DataFrame.from_records(rows, columns = ['origin', 'destination', 'departureDate', 'returnDate', 'stayLength',
+            'departFare', 'returnFare', 'total'])
+        if self.maxPrice:
+            matrix = matrix[matrix['total'] <= self.maxPrice]
+
+        return matrix.sort_values(['total', 'departureDate'], kind = 'stable').reset_index(drop = True)
+
+    def cheapestByDate(self, matrix):
+        """Departure date by return date grid of the cheapest total across airports"""
+        return matrix.pivot_table(index = 'departureDate', columns = 'returnDate', values = 'total', aggfunc = 'min')
@@ -0,0 +1,168 @@
+import math
+import json
+import time
+import threading
+import contextlib
+import collections
+
+import swa
+
+# Errors which suggest SWA is pushing back (detecting automation or not answering), as opposed to
+# problems with a particular query
+SIGNALS = (swa.scrapeDatesNotOpen, swa.scrapeTimeout)
+
+class circuitOpen(Exception):
+
+    def __init__(self, retryIn):
+        super().__init__("Pausing queries to SWA for " + str(int(math.ceil(retryIn))) + " seconds")
+        self.retryIn = retryIn
+
+class tokenBucket(object):
+    """
+    Allows rate requests per minute on average, with up to burst at once. The rate can be changed
+    while in use
+    """
+
+    def __init__(self, rate, burst = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Waits until a request is allowed, returning how many seconds that took"""
+        start = time.time()
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate / 60.0)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - start
+                wait = (1 - self.tokens) * 60.0 / self.rate
+            time.sleep(wait)
+
+class circuitBreaker(object):
+    """
+    Opens after threshold signals within window seconds, refusing requests for cooldown seconds.
+    It's then half open: a single probe request is let through, which closes the breaker if it
+    succeeds, or opens it again for twice as long (up to maxCooldown) if it doesn't
+    """
+
+    def __init__(self, threshold = 5, window = 600, cooldown = 300, maxCooldown = 3600):
+        self.threshold = threshold
+        self.window = window
+        self.baseCooldown = cooldown
+        self.cooldown = cooldown
+        self.maxCooldown = maxCooldown
+        self.state = 'closed'
+        self.signals = collections.deque()
+        self.openedAt = 0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Returns True if this request is the half open probe, or raises circuitOpen if it isn't allowed"""
+        with self.lock:
+            if self.state == 'open':
+                remaining = self.openedAt + self.cooldown - time.time()
+                if remaining > 0:
+                    raise circuitOpen(remaining)
+                self.state = 'halfOpen'
+            if self.state == 'halfOpen':
+                if self.probing:
+                    # Wait for the probe, which shouldn't take longer than a page load
+                    raise circuitOpen(swa.URL_TIMEOUT * 3)
+                self.probing = True
+                return True
+            return False
+
+    def open(self):
+        self.state = 'open'
+        self.openedAt = time.time()
+        self.signals.clear()
+        print(time.strftime('%Y-%m-%d %H:%M:%S') + ": SWA appears to be rejecting queries, pausing for " + str(self.cooldown) + " seconds")
+
+    def success(self, probe):
+        with self.lock:
+            if probe:
+                self.probing = False
+                self.state = 'closed'
+                self.cooldown = self.baseCooldown
+
+    def signal(self, probe):
+        """Records a sign of SWA pushing back, returning True if it opened the breaker"""
+        with self.lock:
+            if probe:
+                self.probing = False
+                self.cooldown = min(self.cooldown * 2, self.maxCooldown)
+                self.open()
+                return True
+
+            now = time.time()
+            self.signals.append(now)
+            while self.signals and (self.signals[0] < now - self.window):
+                self.signals.popleft()
+            if (self.state == 'closed') and (len(self.signals) >= self.threshold):
+                self.open()
+                return True
+            return False
+
+    def release(self, probe):
+        # The probe failed for some other reason, so let another request probe
+        with self.lock:
+            if probe:
+                self.probing = False
+
+class governor(object):
+    """
+    Shared by every backend that queries SWA, so the limits apply across all workers:
+        - a token bucket limiting queries to rate per minute (0 for no limit)
+        - a circuit breaker pausing all queries after threshold SIGNALS (0 to never pause)
+    Each time the breaker opens the rate is halved (down to minRate), and it then creeps back up
+    towards the configured rate with every successful query, so it settles near the highest rate
+    SWA tolerates.
+    SWA also answers with dates not open for trips beyond its published schedule, so that's only
+    taken as a signal for queries which have succeeded before
+    """
+
+    def __init__(self, rate = 0, burst = 1, threshold = 0, window = 600, cooldown = 300, maxCooldown = 3600, minRate = 1):
+        self.maxRate = rate
+        self.minRate = min(minRate, rate) if rate else 0
+        self.bucket = tokenBucket(rate, burst) if rate else None
+        self.breaker = circuitBreaker(threshold, window, cooldown, maxCooldown) if threshold else None
+        self.succeeded = set()
+        self.lock = threading.Lock()
+
+    def isSignal(self, error, queryKey):
+        if isinstance(error, swa.scrapeDatesNotOpen):
+            with self.lock:
+                return queryKey in self.succeeded
+        return isinstance(error, SIGNALS)
+
+    @contextlib.contextmanager
+    def request(self, query = None):
+        queryKey = json.dumps(query, sort_keys = True)
+        probe = self.breaker.allow() if self.breaker else False
+        if self.bucket:
+            self.bucket.acquire()
+
+        try:
+            yield
+        except BaseException as e:
+            if self.breaker and self.isSignal(e, queryKey):
+                if self.breaker.signal(probe) and self.bucket:
+                    self.bucket.rate = max(self.minRate, self.bucket.rate / 2.0)
+            elif self.breaker:
+                self.breaker.release(probe)
+            raise
+
+        with self.lock:
+            self.succeeded.add(queryKey)
+        if self.breaker:
+            self.breaker.success(probe)
+        if self.bucket:
+            # Additive increase: back to the configured rate after about 100 successful queries
+            self.bucket.rate = min(self.maxRate, self.bucket.rate + self.maxRate / 100.0)
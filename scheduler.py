@@ -0,0 +1,129 @@
+import time
+import heapq
+import random
+import datetime
+import threading
+
+# pollInterval is never allowed below this (in minutes), so that SWA isn't queried so
+# frequently that actions are taken to stop scraping
+MIN_INTERVAL = 5
+
+# Exponential backoff after failures stops doubling after this many consecutive failures
+MAX_BACKOFF_FAILURES = 5
+
+# As departure approaches fares move more, so poll more often: (days to departure, interval factor)
+DEPARTURE_FACTORS = [(3, 0.25), (14, 0.5)]
+
+# After the lowest fare changes, poll at this factor of the interval for this many hours
+CHANGE_FACTOR = 0.5
+CHANGE_HOURS = 6
+
+class scheduler(object):
+    """
+    Keeps a heap of when each trip is next due to be scraped. After each scrape a trip is
+    rescheduled based on its pollInterval, adjusted for:
+        - how close the departure date is and whether the fare recently changed (poll more often)
+        - consecutive failures (exponential backoff)
+        - random jitter so trips don't line up and queries don't look automated
+    """
+
+    def __init__(self, trips, pollInterval, jitter = 0.1):
+        self.trips = dict((trip.index, trip) for trip in trips)
+        self.pollInterval = pollInterval
+        self.jitter = jitter
+        self.heap = []
+        self.sequence = 0
+        self.failures = dict((index, 0) for index in self.trips)
+        self.lastChange = {}
+        self.due = {}
+        self.queued = set()
+        self.lock = threading.Lock()
+
+    def schedule(self, index, delay = 0):
+        with self.lock:
+            # The sequence number keeps trips due at the same time in the order they were scheduled
+            self.due[index] = time.time() + delay
+            heapq.heappush(self.heap, (self.due[index], self.sequence, index))
+            self.queued.add(index)
+            self.sequence += 1
+
+    def popDue(self):
+        due = []
+        now = time.time()
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap)[2])
+                self.queued.discard(due[-1])
+        return due
+
+    def timeUntilNext(self):
+        with self.lock:
+            if not self.heap:
+                return None
+            return max(0, self.heap[0][0] - time.time())
+
+    def isScheduled(self, index):
+        with self.lock:
+            return index in self.queued
+
+    def empty(self):
+        with self.lock:
+            return not self.heap
+
+    def interval(self, index):
+        """Returns the interval (in seconds) until the next scrape of a trip, before jitter"""
+        trip = self.trips[index]
+        interval = getattr(trip, 'pollInterval', None) or self.pollInterval
+
+        try:
+            daysToDeparture = (datetime.datetime.strptime(trip.departureDate, "%Y-%m-%d").date() - datetime.datetime.now().date()).days
+            for days, factor in DEPARTURE_FACTORS:
+                if daysToDeparture <= days:
+                    interval *= factor
+                    break
+        except ValueError:
+            pass
+
+        if (index in self.lastChange) and (time.time() - self.lastChange[index] < CHANGE_HOURS * 3600):
+            interval *= CHANGE_FACTOR
+
+        interval = max(interval, MIN_INTERVAL)
+
+        return interval * 60 * (2 ** min(self.failures[index], MAX_BACKOFF_FAILURES))
+
+    def reschedule(self, index):
+        interval = self.interval(index)
+        self.schedule(index, interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def success(self, index, fareChanged = False):
+        self.failures[index] = 0
+        if fareChanged:
+            self.lastChange[index] = time.time()
+        self.reschedule(index)
+
+    def failure(self, index):
+        self.failures[index] += 1
+        self.reschedule(index)
+
+    def checkpoint(self, index):
+        return {
+            'due': self.due.get(index),
+            'failures': self.failures[index],
+            'lastChange': self.lastChange.get(index)
+        }
+
+    def resume(self, index, saved):
+        """
+        Schedules a trip from a checkpoint: when it was due before the restart. Trips that became due
+        while swatcher wasn't running are spread over MIN_INTERVAL, rather than all scraped at once
+        """
+        self.failures[index] = saved['failures']
+        if saved['lastChange'] is not None:
+            self.lastChange[index] = saved['lastChange']
+
+        if saved['due'] is None:
+            self.schedule(index)
+        elif saved['due'] > time.time():
+            self.schedule(index, saved['due'] - time.time())
+        else:
+            self.schedule(index, random.uniform(0, MIN_INTERVAL * 60))
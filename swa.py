@@ -3,6 +3,7 @@ import requests
 import collections
 import datetime
 import re
+import threading
 
 from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
@@ -14,6 +15,22 @@ from selenium.common.exceptions import NoSuchElementException
 URL = "https://www.southwest.com/air/booking/select.html"
 URL_TIMEOUT = 20
 
+# Once results start to appear, they are considered fully rendered when the price matrices (row count
+# and fare text) stay the same for READY_INTERVAL seconds, giving up after READY_TIMEOUT seconds
+READY_INTERVAL = 0.5
+READY_TIMEOUT = 10
+API_URL = "https://www.southwest.com/api/air-booking/v1/air-booking/page/air/booking/shopping"
+CALENDAR_URL = "https://www.southwest.com/air/low-fare-calendar/select-dates.html"
+
+# Class names used by the low fare calendar page. There is one calendar per leg (departing, then returning),
+# each made up of days showing the day of the month and the lowest fare for that day. These haven't been
+# checked against a live page yet (tests/fixtures/calendar.html is built from them), so update both if no
+# calendar is found
+CALENDAR_CLASS = "low-fare-calendar"
+CALENDAR_DAY_CLASS = "low-fare-calendar-day"
+CALENDAR_DATE_CLASS = "low-fare-calendar-day--date"
+CALENDAR_FARE_CLASS = "low-fare-calendar-day--price"
+
 # Preload a dictionary. These are values that are supported by the SWA REST API, but currently unconfigurable
 # Some of these can be omitted, but for completeness, I'm including them with default values.
 defaultOptions = {
@@ -28,6 +45,25 @@ defaultOptions = {
     'leapfrogRequest':'true'
 }
 
+# Counters of how scrapes went, shared by all threads (eg: how often the page had to be reloaded)
+statistics = collections.Counter()
+statisticsLock = threading.Lock()
+
+def recordStatistic(name, count = 1):
+    with statisticsLock:
+        statistics[name] += count
+
+def statisticsSnapshot():
+    with statisticsLock:
+        return dict(statistics)
+
+def recordTiming(timings, phase, start):
+    # Adds the time since start to a phase, returning now so it can be used as the start of the next phase
+    now = time.time()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0) + (now - start)
+    return now
+
 class scrapeValidation(Exception):
     pass
 
@@ -99,57 +135,230 @@ def validatePassengersCount(passengersCount):
     else:
         raise scrapeValidation("validatePassengersCount: '" + passengersCount + "' must be 1 through 8")
 
-def scrapeFare(element, className):
+def parseFare(fare):
 
-    fare = element.find_element(by=By.CLASS_NAME, value=className).text
-    if(("Unavailable" in fare) or ("Sold out" in fare)):
+    if((fare is None) or ("Unavailable" in fare) or ("Sold out" in fare)):
         return None
     else:
         return int(fare.split("$")[1].split()[0])
 
-def scrapeFlights(flight):
+def parseDuration(duration):
 
-    flightDetails = {}
+    durationList = duration.split()
+    # For flight duration, just round to 2 decimal places - that should be more than enough
+    return round(float(durationList[0].split("h")[0]) +  ((float(durationList[1].split("m")[0])/60.0) + .001), 2)
 
-    flightDetails['flight'] = WebDriverWait(flight, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "flight-numbers--flight-number"))) \
-        .text.replace(' ','').replace('#', '')
+def parseStops(flightStops):
 
-    departTime, arriveTime = flight.find_elements(by=By.CLASS_NAME, value="select-detail--time")
-    flightDetails['departTime'] = departTime.text
+    # For flights which are non-stop, SWA doesn't display data after the duration
+    return 0 if flightStops == 'Nonstop' else int(flightStops.split(' ')[0])
+
+def parseFlightDetails(flight, departTime, arriveTime, duration, stops, fare, fareAnytime, fareBusinessSelect):
+
+    flightDetails = {}
+
+    flightDetails['flight'] = flight.replace(' ','').replace('#', '')
+    flightDetails['departTime'] = departTime
     # Text here can contain "Next Day", so just take time portion
-    flightDetails['arriveTime'] = arriveTime.text.split('\n')[0]
+    flightDetails['arriveTime'] = arriveTime.split('\n')[0]
+    flightDetails['duration'] = parseDuration(duration)
+    flightDetails['stops'] = parseStops(stops)
+    flightDetails['fare'] = parseFare(fare)
+    flightDetails['fareAnytime'] = parseFare(fareAnytime)
+    flightDetails['fareBusinessSelect'] = parseFare(fareBusinessSelect)
 
-    durationList = WebDriverWait(flight, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "select-detail--flight-duration"))).text.split()
-    # For flight duration, just round to 2 decimal places - that should be more than enough
-    flightDetails['duration'] = round(float(durationList[0].split("h")[0]) +  ((float(durationList[1].split("m")[0])/60.0) + .001), 2)
+    return flightDetails
 
-    # For flights which are non-stop, SWA doesn't display data after the duration
-    flightStops = flight.find_element(by=By.CLASS_NAME, value="flight-stops-badge").text
-    flightDetails['stops'] = 0 if flightStops == 'Nonstop' else int(flightStops.split(' ')[0])
+def scrapeFare(element, className):
+
+    return parseFare(element.find_element(by=By.CLASS_NAME, value=className).text)
+
+def scrapeFlights(flight):
+
+    flightNumber = WebDriverWait(flight, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "flight-numbers--flight-number"))).text
+    departTime, arriveTime = flight.find_elements(by=By.CLASS_NAME, value="select-detail--time")
+    duration = WebDriverWait(flight, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "select-detail--flight-duration"))).text
 
     # fare-button_primary-yellow == wannaGetAway
     # fare-button_secondary-light-blue == anytime
     # fare-button_primary-blue == businessSelect
-    flightDetails['fare'] = scrapeFare(flight, "fare-button_primary-yellow")
-    flightDetails['fareAnytime'] = scrapeFare(flight, "fare-button_secondary-light-blue")
-    flightDetails['fareBusinessSelect'] = scrapeFare(flight, "fare-button_fare-type-color")
+    return parseFlightDetails(
+        flight = flightNumber,
+        departTime = departTime.text,
+        arriveTime = arriveTime.text,
+        duration = duration,
+        stops = flight.find_element(by=By.CLASS_NAME, value="flight-stops-badge").text,
+        fare = flight.find_element(by=By.CLASS_NAME, value="fare-button_primary-yellow").text,
+        fareAnytime = flight.find_element(by=By.CLASS_NAME, value="fare-button_secondary-light-blue").text,
+        fareBusinessSelect = flight.find_element(by=By.CLASS_NAME, value="fare-button_fare-type-color").text
+    )
+
+def extractFlightsElement(driver):
 
-    return flightDetails
+    priceMatrixes = driver.find_elements(by=By.CLASS_NAME, value="air-booking-select-price-matrix")
 
-def scrape(
-        driver,
-        originationAirportCode, # 3 letter airport code (eg: MDW - for Midway, Chicago, Illinois)
-        destinationAirportCode, # 3 letter airport code (eg: MCO - for Orlando, Florida)
-        departureDate, # Flight departure date in YYYY-MM-DD format
-        returnDate, # Flight return date in YYYY-MM-DD format (for roundtrip, otherwise ignored)
-        tripType = 'roundtrip', # Can be either 'roundtrip' or 'oneway'
-        departureTimeOfDay = 'ALL_DAY', # Can be either 'ALL_DAY', 'BEFORE_NOON', 'NOON_TO_SIX', or 'AFTER_SIX' (CASE SENSITIVE)
-        returnTimeOfDay = 'ALL_DAY', # Can be either 'ALL_DAY', 'BEFORE_NOON', 'NOON_TO_SIX', or 'AFTER_SIX' (CASE SENSITIVE)
-        adultPassengersCount = 1, # Can be a value of between 1 and 8
-        debug = False
+    return [[scrapeFlights(e) for e in priceMatrix.find_elements(by=By.CLASS_NAME, value="air-booking-select-detail")]
+        for priceMatrix in priceMatrixes]
+
+# Pulls the text of every flight row out of all price matrices in a single round-trip to the WebDriver,
+# instead of ~10 element lookups per row. innerText matches what Selenium reports for .text
+BULK_EXTRACT_SCRIPT = """
+function text(row, className) {
+    var element = row.getElementsByClassName(className)[0];
+    return element ? element.innerText : null;
+}
+var matrixes = document.getElementsByClassName('air-booking-select-price-matrix');
+return Array.prototype.map.call(matrixes, function(matrix) {
+    return Array.prototype.map.call(matrix.getElementsByClassName('air-booking-select-detail'), function(row) {
+        var times = row.getElementsByClassName('select-detail--time');
+        return {
+            flight: text(row, 'flight-numbers--flight-number'),
+            departTime: times.length > 0 ? times[0].innerText : null,
+            arriveTime: times.length > 1 ? times[1].innerText : null,
+            duration: text(row, 'select-detail--flight-duration'),
+            stops: text(row, 'flight-stops-badge'),
+            fare: text(row, 'fare-button_primary-yellow'),
+            fareAnytime: text(row, 'fare-button_secondary-light-blue'),
+            fareBusinessSelect: text(row, 'fare-button_fare-type-color')
+        };
+    });
+});
+"""
+
+def extractFlightsBulk(driver):
+
+    priceMatrixes = driver.execute_script(BULK_EXTRACT_SCRIPT)
+
+    return [[parseFlightDetails(**row) for row in priceMatrix] for priceMatrix in priceMatrixes]
+
+# Tags that start a new line of rendered text, so that text matches what the browser reports for .text
+# (eg: arrival times followed by a "Next Day" indicator)
+HTML_BLOCK_TAGS = ['div', 'p', 'li', 'ul', 'br', 'tr', 'section']
+
+def htmlClassXPath(className):
+    return ".//*[contains(concat(' ', normalize-space(@class), ' '), ' " + className + " ')]"
+
+def htmlElementText(element):
+
+    parts = []
+
+    def walk(node):
+            # Comments/processing instructions don't have a string tag, and text only meant
+            # for screen readers is not rendered, so it isn't part of what Selenium sees either
+        if((not isinstance(node.tag, str)) or ("screen-reader-only" in (node.get('class') or ''))):
+            return
+
+        block = node.tag in HTML_BLOCK_TAGS
+        if block:
+            parts.append('\n')
+        if node.text:
+            parts.append(node.text)
+        for child in node:
+            walk(child)
+            if child.tail:
+                parts.append(child.tail)
+        if block:
+            parts.append('\n')
+
+    walk(element)
+
+    lines = [' '.join(line.split()) for line in ''.join(parts).split('\n')]
+    return '\n'.join([line for line in lines if line])
+
+def htmlFirstText(element, className):
+
+    matches = element.xpath(htmlClassXPath(className))
+    return htmlElementText(matches[0]) if matches else None
+
+def parseFlightsHtml(html):
+
+        # importing this way keeps people who aren't interested in lxml from installing it..
+    lxml = __import__('lxml.html')
+
+    document = lxml.html.fromstring(html)
+
+    priceMatrixes = []
+    for priceMatrix in document.xpath(htmlClassXPath("air-booking-select-price-matrix")):
+        flights = []
+        for flight in priceMatrix.xpath(htmlClassXPath("air-booking-select-detail")):
+            times = flight.xpath(htmlClassXPath("select-detail--time"))
+            flights.append(parseFlightDetails(
+                flight = htmlFirstText(flight, "flight-numbers--flight-number"),
+                departTime = htmlElementText(times[0]),
+                arriveTime = htmlElementText(times[1]),
+                duration = htmlFirstText(flight, "select-detail--flight-duration"),
+                stops = htmlFirstText(flight, "flight-stops-badge"),
+                fare = htmlFirstText(flight, "fare-button_primary-yellow"),
+                fareAnytime = htmlFirstText(flight, "fare-button_secondary-light-blue"),
+                fareBusinessSelect = htmlFirstText(flight, "fare-button_fare-type-color")
+            ))
+        priceMatrixes.append(flights)
+
+    return priceMatrixes
+
+def parseFlightsHtmlFile(fileName):
+
+    with open(fileName, encoding='utf-8') as htmlFile:
+        return parseFlightsHtml(htmlFile.read())
+
+def extractFlightsHtml(driver):
+
+    return parseFlightsHtml(driver.page_source)
+
+# Returns the row count and fare text of each price matrix, which changes while results are still rendering
+READY_SCRIPT = """
+var matrixes = document.getElementsByClassName('air-booking-select-price-matrix');
+return Array.prototype.map.call(matrixes, function(matrix) {
+    var fares = matrix.querySelectorAll('[class*="fare-button_"]');
+    return [
+        matrix.getElementsByClassName('air-booking-select-detail').length,
+        Array.prototype.map.call(fares, function(fare) { return fare.innerText; }).join('|')
+    ];
+});
+"""
+
+def waitForStableResults(driver, matrixCount, timeout = READY_TIMEOUT, interval = READY_INTERVAL):
+
+    previous = None
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        current = driver.execute_script(READY_SCRIPT)
+        # A matrix without rows may just not have been filled in yet, and the page doesn't say when a day
+        # really has no flights, so empty matrices are never taken as ready. They're left to the reload
+        rendered = (len(current) >= matrixCount) and all(matrix[0] > 0 for matrix in current[:matrixCount])
+        if rendered and (current == previous):
+            return True
+        previous = current
+        time.sleep(interval)
+
+    return False
+
+def validateExtraction(extraction):
+
+    if(extraction not in extractionMethods):
+        raise scrapeValidation("validateExtraction: '" + extraction + "' not valid, must be one of " + ", ".join(extractionMethods))
+
+    return extractionMethods[extraction]
+
+extractionMethods = {
+    'element': extractFlightsElement,
+    'bulk': extractFlightsBulk,
+    'html': extractFlightsHtml
+}
+
+def buildPayload(
+        originationAirportCode,
+        destinationAirportCode,
+        departureDate,
+        returnDate,
+        tripType,
+        departureTimeOfDay,
+        returnTimeOfDay,
+        adultPassengersCount
     ):
 
-    payload = defaultOptions
+    # Copy so concurrent scrapes don't share (and overwrite) the same parameters
+    payload = dict(defaultOptions)
 
     # Validate the parameters to ensure nothing is blatently erroneous then load into map
     payload['originationAirportCode'] = validateAirportCode(originationAirportCode)
@@ -165,11 +374,49 @@ def scrape(
     else:
         payload['returnDate'] = '' # SWA REST requires presence of this parameter, even on a 'oneway'
 
+    return payload
+
+def splitFlights(tripType, priceMatrixes):
+
+    departFlights, returnFlights = [], []
+    if tripType == 'roundtrip':
+        if len(priceMatrixes) != 2:
+            raise Exception("Only one set of prices returned for round-trip travel")
+
+        departFlights += priceMatrixes[0]
+        returnFlights += priceMatrixes[1]
+    else:
+        departFlights += priceMatrixes[0]
+
+    return departFlights, returnFlights
+
+def scrape(
+        driver,
+        originationAirportCode, # 3 letter airport code (eg: MDW - for Midway, Chicago, Illinois)
+        destinationAirportCode, # 3 letter airport code (eg: MCO - for Orlando, Florida)
+        departureDate, # Flight departure date in YYYY-MM-DD format
+        returnDate, # Flight return date in YYYY-MM-DD format (for roundtrip, otherwise ignored)
+        tripType = 'roundtrip', # Can be either 'roundtrip' or 'oneway'
+        departureTimeOfDay = 'ALL_DAY', # Can be either 'ALL_DAY', 'BEFORE_NOON', 'NOON_TO_SIX', or 'AFTER_SIX' (CASE SENSITIVE)
+        returnTimeOfDay = 'ALL_DAY', # Can be either 'ALL_DAY', 'BEFORE_NOON', 'NOON_TO_SIX', or 'AFTER_SIX' (CASE SENSITIVE)
+        adultPassengersCount = 1, # Can be a value of between 1 and 8
+        debug = False,
+        extraction = 'bulk', # Can be 'bulk' (single script call per page), 'html' (parse page source) or 'element' (per element lookups)
+        url = URL, # Booking page to load, can be overridden to point at a local server
+        timings = None # If a dict, the seconds spent in each phase (pageLoad, wait, ready, reload, extraction) are added to it
+    ):
+
+    payload = buildPayload(originationAirportCode, destinationAirportCode, departureDate, returnDate,
+        tripType, departureTimeOfDay, returnTimeOfDay, adultPassengersCount)
+    extractFlights = validateExtraction(extraction)
+
     query =  '&'.join(['%s=%s' % (key, value) for (key, value) in payload.items()])
 
-    fullUrl = URL + '?' + query
+    fullUrl = url + '?' + query
     # print(fullUrl)
+    start = time.time()
     driver.get(fullUrl)
+    start = recordTiming(timings, 'pageLoad', start)
 
     waitCSS = ".page-error--list, .trip--form-container, "
     waitCSS += "#air-booking-product-1" if tripType == 'roundtrip' else "#air-booking-product-0"
@@ -177,6 +424,7 @@ def scrape(
     try:
         element = WebDriverWait(driver, URL_TIMEOUT).until(EC.element_to_be_clickable((By.CSS_SELECTOR, waitCSS)))
         # driver.implicitly_wait(10)
+        start = recordTiming(timings, 'wait', start)
 
     except TimeoutException:
         raise scrapeTimeout("scrape: Timeout occurred after " + str(URL_TIMEOUT) + " seconds waiting for web result")
@@ -185,7 +433,8 @@ def scrape(
         raise scrapeGeneral("scrape: General exception occurred - " + message)
     finally:
         if debug:
-            open("dump-" + datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + ".html", "w").write(u''.join((driver.page_source)).encode('utf-8').strip())
+            with open("dump-" + datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + ".html", "w", encoding='utf-8') as dumpFile:
+                dumpFile.write(driver.page_source.strip())
 
     if("page-error--list" in element.get_attribute("class")):
             # In the past (Until 2018-05-26) SWA returned a special class identifier (error-no-routes-exist) to more
@@ -200,25 +449,260 @@ def scrape(
             # parameters supplied are most likely bad
         raise scrapeValidation("scrape: SWA Website reported what appears to be errors with parameters")
 
-    # Refresh to make sure it loads everything
-    driver.get(fullUrl)
-    element = WebDriverWait(driver, URL_TIMEOUT).until(EC.element_to_be_clickable((By.CSS_SELECTOR, waitCSS)))
+    # Rather than always loading the page a second time to make sure it loads everything, only
+    # reload if the results never settle down
+    recordStatistic('scrapes')
+    start = time.time()
+    ready = waitForStableResults(driver, 2 if payload['tripType'] == 'roundtrip' else 1)
+    start = recordTiming(timings, 'ready', start)
+    if not ready:
+        recordStatistic('reloadFallbacks')
+        driver.get(fullUrl)
+        element = WebDriverWait(driver, URL_TIMEOUT).until(EC.element_to_be_clickable((By.CSS_SELECTOR, waitCSS)))
+        start = recordTiming(timings, 'reload', start)
 
     # If here, we should have results, so  parse out...
-    priceMatrixes = driver.find_elements(by=By.CLASS_NAME, value="air-booking-select-price-matrix")
+    priceMatrixes = extractFlights(driver)
+    recordTiming(timings, 'extraction', start)
 
-    departFlights, returnFlights = [], []
-    if payload['tripType'] == 'roundtrip':
-        if len(priceMatrixes) != 2:
-            raise Exception("Only one set of prices returned for round-trip travel")
+    return splitFlights(payload['tripType'], priceMatrixes)
+
+def createSession(poolSize = 10, apiKey = ''):
+
+    import requests.adapters
+
+    # One session is shared by all trips, so connections (and TLS handshakes) are reused across scrapes
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections = poolSize, pool_maxsize = poolSize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'User-Agent': "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.87 Safari/537.36",
+        'Content-Type': 'application/json',
+        'Accept': 'application/json'
+    })
+    if apiKey:
+        session.headers['X-API-Key'] = apiKey
+
+    return session
 
-        elements = priceMatrixes[0].find_elements(by=By.CLASS_NAME, value="air-booking-select-detail")
-        departFlights += [scrapeFlights(e) for e in elements]
+def parseTimeJson(time):
 
-        elements = priceMatrixes[1].find_elements(by=By.CLASS_NAME, value="air-booking-select-detail")
-        returnFlights += [scrapeFlights(e) for e in elements]
+    # The API reports 24 hour times (eg: 18:05), where the web page displays 6:05PM
+    hour, minute = time.split(':')[0:2]
+    return str(int(hour) % 12 or 12) + ':' + minute + ('PM' if int(hour) >= 12 else 'AM')
+
+def parseFareJson(fareProduct):
+
+    if((not fareProduct) or (fareProduct.get('availabilityStatus', 'AVAILABLE') != 'AVAILABLE')):
+        return None
     else:
-        for element in priceMatrixes[0].find_elements(by=By.CLASS_NAME, value="air-booking-select-detail"):
-            departFlights.append(scrapeFlights(element))
+        return int(round(float(fareProduct['fare']['totalFare']['value'])))
 
-    return departFlights, returnFlights
+def parseFlightJson(detail):
+
+    flightDetails = {}
+
+    fareProducts = detail.get('fareProducts', {}).get('ADULT', {})
+
+    flightDetails['flight'] = '/'.join(detail['flightNumbers'])
+    flightDetails['departTime'] = parseTimeJson(detail['departureTime'])
+    flightDetails['arriveTime'] = parseTimeJson(detail['arrivalTime'])
+    # Same rounding as the web page duration, which is displayed in hours and minutes
+    flightDetails['duration'] = round((detail['totalDuration'] / 60.0) + .001, 2)
+    flightDetails['stops'] = len(detail.get('stopsDetails', [None])) - 1
+    flightDetails['fare'] = parseFareJson(fareProducts.get('WGA'))
+    flightDetails['fareAnytime'] = parseFareJson(fareProducts.get('ANY'))
+    flightDetails['fareBusinessSelect'] = parseFareJson(fareProducts.get('BUS'))
+
+    return flightDetails
+
+def parseFlightsJson(response):
+
+    data = response.get('data') or {}
+    airProducts = (data.get('searchResults') or {}).get('airProducts')
+
+    if not airProducts:
+        notifications = response.get('notifications') or {}
+        codes = [n.get('code', '') for n in (notifications.get('formErrors') or []) + (notifications.get('fieldErrors') or [])]
+        if any('NO_ROUTES_EXIST' in code or 'NOT_OPEN' in code for code in codes):
+            raise scrapeDatesNotOpen("")
+        elif codes:
+            raise scrapeValidation("scrapeHttp: SWA API reported errors with parameters - " + ", ".join(codes))
+        raise scrapeGeneral("scrapeHttp: SWA API response did not contain any flights")
+
+    return [[parseFlightJson(detail) for detail in (airProduct or {}).get('details', [])] for airProduct in airProducts]
+
+def scrapeHttp(
+        session,
+        originationAirportCode,
+        destinationAirportCode,
+        departureDate,
+        returnDate,
+        tripType = 'roundtrip',
+        departureTimeOfDay = 'ALL_DAY',
+        returnTimeOfDay = 'ALL_DAY',
+        adultPassengersCount = 1,
+        debug = False,
+        url = API_URL
+    ):
+
+    payload = buildPayload(originationAirportCode, destinationAirportCode, departureDate, returnDate,
+        tripType, departureTimeOfDay, returnTimeOfDay, adultPassengersCount)
+    payload['application'] = 'air-booking'
+    payload['site'] = 'southwest'
+    payload['adultPassengersCount'] = str(payload['adultPassengersCount'])
+
+    try:
+        result = session.post(url, json = payload, timeout = URL_TIMEOUT)
+    except requests.exceptions.Timeout:
+        raise scrapeTimeout("scrapeHttp: Timeout occurred after " + str(URL_TIMEOUT) + " seconds waiting for API result")
+    except Exception as ex:
+        message = "An {0} exception occurred:\n{1!r}".format(type(ex).__name__, ex)
+        raise scrapeGeneral("scrapeHttp: General exception occurred - " + message)
+
+        # Errors (such as routes not being open) are reported as JSON notifications alongside a 4xx status,
+        # so the status is only a failure if there isn't JSON to explain it
+    try:
+        response = result.json()
+    except ValueError:
+        raise scrapeGeneral("scrapeHttp: SWA API returned status " + str(result.status_code) + " without JSON content")
+
+    if debug:
+        with open("dump-" + datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + ".json", "w", encoding='utf-8') as dumpFile:
+            dumpFile.write(result.text)
+
+    return splitFlights(payload['tripType'], parseFlightsJson(response))
+
+def validateMonth(month):
+
+    try:
+        firstDay = datetime.datetime.strptime(month, "%Y-%m").date()
+    except Exception as ex:
+        raise scrapeValidation("validateMonth: '" + month + "' not in the format YYYY-MM or invalid")
+
+    lastDay = (firstDay.replace(day = 28) + datetime.timedelta(days = 4)).replace(day = 1) - datetime.timedelta(days = 1)
+    tomorrow = datetime.datetime.now().date() + datetime.timedelta(days = 1)
+
+    if(lastDay < tomorrow):
+        raise scrapeDatePast("validateMonth: '" + month + "' invalid - scraping can only be done until day before flight")
+
+    return max(firstDay, tomorrow), lastDay
+
+def parseCalendarHtml(html, month):
+    """
+    Returns a list (one per leg) of {date: lowest fare} for the days of the month in a low fare
+    calendar page. Days which are unavailable/sold out have a fare of None
+    """
+
+        # importing this way keeps people who aren't interested in lxml from installing it..
+    lxml = __import__('lxml.html')
+
+    document = lxml.html.fromstring(html)
+    firstDay = datetime.datetime.strptime(month, "%Y-%m").date()
+
+    calendars = []
+    for calendar in document.xpath(htmlClassXPath(CALENDAR_CLASS)):
+        fares = collections.OrderedDict()
+        for day in calendar.xpath(htmlClassXPath(CALENDAR_DAY_CLASS)):
+            date = htmlFirstText(day, CALENDAR_DATE_CLASS)
+            if not date:
+                continue # Padding before the first/after the last day of the month
+            fare = htmlFirstText(day, CALENDAR_FARE_CLASS)
+            fares[firstDay.replace(day = int(date)).strftime("%Y-%m-%d")] = parseFare(fare) if fare and ('$' in fare or 'Unavailable' in fare or 'Sold out' in fare) else None
+        calendars.append(fares)
+
+    return calendars
+
+def scrapeCalendar(
+        driver,
+        originationAirportCode, # 3 letter airport code (eg: MDW - for Midway, Chicago, Illinois)
+        destinationAirportCode, # 3 letter airport code (eg: MCO - for Orlando, Florida)
+        month, # Month to sweep in YYYY-MM format
+        tripType = 'roundtrip', # Can be either 'roundtrip' or 'oneway'
+        adultPassengersCount = 1, # Can be a value of between 1 and 8
+        debug = False,
+        url = CALENDAR_URL
+    ):
+    """
+    Loads the low fare calendar for a month, which shows the lowest fare for every day in a single
+    page, returning ({date: fare} departing, {date: fare} returning)
+    """
+
+    firstDay, lastDay = validateMonth(month)
+
+    payload = dict(defaultOptions)
+    payload['originationAirportCode'] = validateAirportCode(originationAirportCode)
+    payload['destinationAirportCode'] = validateAirportCode(destinationAirportCode)
+    payload['tripType'] = validateTripType(tripType)
+    payload['adultPassengersCount'] = validatePassengersCount(adultPassengersCount)
+    payload['currencyCode'] = 'USD'
+    payload['departureDate'] = firstDay.strftime("%Y-%m-%d")
+    payload['returnDate'] = lastDay.strftime("%Y-%m-%d") if tripType == 'roundtrip' else ''
+
+    query =  '&'.join(['%s=%s' % (key, value) for (key, value) in payload.items()])
+    driver.get(url + '?' + query)
+
+    try:
+        element = WebDriverWait(driver, URL_TIMEOUT).until(EC.presence_of_element_located((By.CSS_SELECTOR, ".page-error--list, ." + CALENDAR_CLASS)))
+    except TimeoutException:
+        raise scrapeTimeout("scrapeCalendar: Timeout occurred after " + str(URL_TIMEOUT) + " seconds waiting for web result")
+    except Exception as ex:
+        message = "An {0} exception occurred:\n{1!r}".format(type(ex).__name__, ex)
+        raise scrapeGeneral("scrapeCalendar: General exception occurred - " + message)
+
+    if("page-error--list" in element.get_attribute("class")):
+        raise scrapeDatesNotOpen("")
+
+    pageSource = driver.page_source
+    if debug:
+        with open("dump-calendar-" + datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + ".html", "w", encoding='utf-8') as dumpFile:
+            dumpFile.write(pageSource.strip())
+
+    calendars = parseCalendarHtml(pageSource, month)
+    if tripType == 'roundtrip':
+        if len(calendars) != 2:
+            raise scrapeGeneral("scrapeCalendar: Expected two calendars for round-trip travel, found " + str(len(calendars)))
+        return calendars[0], calendars[1]
+
+    if not calendars:
+        raise scrapeGeneral("scrapeCalendar: No calendar found")
+    return calendars[0], collections.OrderedDict()
+
+def scrapeCalendarDrillDown(
+        driver,
+        originationAirportCode,
+        destinationAirportCode,
+        month,
+        maxPrice, # Only days with a lowest fare at or below this are scraped in full (0 for every day with a fare)
+        tripType = 'roundtrip',
+        departureTimeOfDay = 'ALL_DAY',
+        returnTimeOfDay = 'ALL_DAY',
+        adultPassengersCount = 1,
+        debug = False,
+        extraction = 'bulk',
+        url = CALENDAR_URL
+    ):
+    """
+    Sweeps a month with the low fare calendar, then runs a full (oneway) scrape() only for the days
+    of each leg that meet maxPrice. Returns (departFares, returnFares, departFlights, returnFlights),
+    where the fares are the calendar {date: fare}, and the flights are {date: flights} for the days
+    that were scraped
+    """
+
+    departFares, returnFares = scrapeCalendar(driver, originationAirportCode, destinationAirportCode, month,
+        tripType, adultPassengersCount, debug, url)
+    # The calendar shows the whole month, but days before tomorrow can't be scraped
+    firstDay = validateMonth(month)[0].strftime("%Y-%m-%d")
+
+    departFlights, returnFlights = collections.OrderedDict(), collections.OrderedDict()
+    for fares, flights, origin, destination, timeOfDay in [
+            (departFares, departFlights, originationAirportCode, destinationAirportCode, departureTimeOfDay),
+            (returnFares, returnFlights, destinationAirportCode, originationAirportCode, returnTimeOfDay)]:
+        for date, fare in fares.items():
+            if (date < firstDay) or (fare is None) or (maxPrice and (fare > maxPrice)):
+                continue
+            flights[date] = scrape(driver, origin, destination, date, '', tripType = 'oneway', departureTimeOfDay = timeOfDay,
+                adultPassengersCount = adultPassengersCount, debug = debug, extraction = extraction)[0]
+
+    return departFares, returnFares, departFlights, returnFlights
@@ -1,30 +1,92 @@
 import argparse
 import time
-import selenium
 import datetime
-import os, json
-import pandas as pd
+import os
+import queue
+import collections
+import itertools
+import threading
+import traceback
+import concurrent.futures
 
 import swa
+import backends
+import history
+import fares
+import scheduler
+import notifier
+import cache
+import browser
+import metrics
+import checkpoint
+import jobqueue
+import ratelimit
 import configuration
 
 DEFAULT_CONFIGURATION_FILE = "swatcher.ini"
 
+# Metrics counter incremented for each (unsuccessful) scrape outcome
+OUTCOME_COUNTERS = {
+    'validation': 'errors',
+    'datesNotOpen': 'datesNotOpen',
+    'timeout': 'timeouts',
+    'queueTimeout': 'timeouts',
+    'browserFault': 'errors',
+    'error': 'errors'
+}
+
 class State(object):
 
-    def __init__(self):
+    def __init__(self, historyLength = 100):
         self.errorCount = 0
         self.currentLowestFare = None
         self.blockQuery = False
-        self.notificationHistory = ''
+        # Most recent notification first, only keeping the last historyLength so memory stays bounded
+        self.notificationHistory = collections.deque(maxlen = historyLength)
+        self.tripDetails = ''
         self.dailyAlertDate = datetime.datetime.now().date()
 
+    def checkpoint(self):
+        return {
+            'errorCount': self.errorCount,
+            'currentLowestFare': self.currentLowestFare,
+            'blockQuery': self.blockQuery,
+            'notificationHistory': list(self.notificationHistory),
+            'started': bool(self.tripDetails),
+            'dailyAlertDate': self.dailyAlertDate.isoformat()
+        }
+
+    def restore(self, saved):
+        self.errorCount = saved['errorCount']
+        self.currentLowestFare = saved['currentLowestFare']
+        self.blockQuery = saved['blockQuery']
+        self.notificationHistory.clear()
+        self.notificationHistory.extend(saved['notificationHistory'][:self.notificationHistory.maxlen])
+        self.dailyAlertDate = datetime.date.fromisoformat(saved['dailyAlertDate'])
+
 
 class swatcher(object):
 
     def __init__(self):
         self.states = []
         self.config = None
+        # Serializes per-trip persistence and notifications when trips are scraped by multiple workers
+        self.lock = threading.RLock()
+        self.httpBackend = None
+        self.history = None
+        self.fareTrackers = []
+        self.evaluator = None
+        self.scheduler = None
+        self.notifier = None
+        self.resultCache = None
+        self.driverManager = None
+        self.browserPool = None
+        self.metrics = metrics.registry()
+        self.jobQueue = None
+        self.queueBackends = None
+        self.stateJournal = None
+        # Orders checkpoint records by when their state was read (see checkpoint.journal)
+        self.checkpointStamps = itertools.count()
 
     def now(self):
         return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -38,29 +100,52 @@ class swatcher(object):
             help = "Configuration file to use. If unspecified, will be '" + DEFAULT_CONFIGURATION_FILE + "'",
             default = DEFAULT_CONFIGURATION_FILE)
 
+        parser.add_argument('command',
+            nargs = '?',
+            choices = ['monitor', 'worker'],
+            help = "'monitor' (the default) watches the configured trips. 'worker' only scrapes jobs from the [queue] database for a monitoring swatcher",
+            default = 'monitor')
+
+        parser.add_argument('--profile',
+            dest = 'profileFile',
+            help = "Query every trip once under cProfile, save the profile to this file, then exit",
+            default = None)
+
         args = parser.parse_args()
 
         return args
 
-    def initializeLogs(self, index):
+    def describeTrip(self, index):
 
-        tripHistory = os.linesep + "Trip Details:"
-        ignoreKeys = ['index', 'description']
+        tripDetails = os.linesep + "Trip Details:"
+        ignoreKeys = ['index', 'description', 'plan']
         for key in self.config.trips[index].__dict__:
             if any(x in key for x in ignoreKeys):
                 continue
-            tripHistory += os.linesep + "   " + key + ": " + str(self.config.trips[index].__dict__[key])
+            tripDetails += os.linesep + "   " + key + ": " + str(self.config.trips[index].__dict__[key])
+        return tripDetails
+
+    def initializeLogs(self, index):
+
+        self.states[index].tripDetails = self.describeTrip(index)
 
         if self.config.historyFileBase:
             try:
                 historyFileName = self.config.historyFileBase + "-" + str(index) + ".history"
-                with open(historyFileName) as historyFile:
-                    for line in historyFile:
-                        tripHistory = line + tripHistory
+                # Only the end of the file is read, as older entries wouldn't fit in the history anyway
+                for line in history.tailLines(historyFileName, self.states[index].notificationHistory.maxlen):
+                    self.states[index].notificationHistory.appendleft(line)
             except IOError as e:
                 pass
 
-        return tripHistory
+    def notificationSummary(self, index):
+
+        notificationHistory = list(self.states[index].notificationHistory)
+        summary = os.linesep.join(notificationHistory[:self.config.notificationSummaryLength])
+        if len(notificationHistory) > self.config.notificationSummaryLength:
+            summary += os.linesep + "... " + str(len(notificationHistory) - self.config.notificationSummaryLength) + " earlier notifications"
+
+        return summary + os.linesep + self.states[index].tripDetails
 
     def appendLogFile(self, index, message):
         if self.config.historyFileBase:
@@ -71,176 +156,252 @@ class swatcher(object):
             except IOError as e:
                 pass
 
-    def initializeCsvHistory(self, trip):
-        trip_name = trip.description.split('/')[-1]
-        file_path = os.path.join(self.config.tripsDir, f"{trip_name}.csv")
-        if os.path.exists(file_path):
-            # File exists so it's already initialized
-            return
-        os.makedirs(self.config.tripsDir, exist_ok=True)
-        columns = ['query_datetime', 'returnOrDepart', 'flight', 'departTime', 'arriveTime', 'duration', 'stops', 'fare', 'fareAnytime', 'fareBusinessSelect']
-        pd.DataFrame(columns=columns).to_csv(file_path, index=False)
-        with open(os.path.join(self.config.tripsDir, f'{trip_name}_config.json'), 'w') as f:
-            json.dump({
-                'adultPassengersCount': trip.adultPassengersCount,
-                'departureDate': trip.departureDate,
-                'departureTimeOfDay': trip.departureTimeOfDay,
-                'description': trip.description,
-                'destinationAirportCode': trip.destinationAirportCode,
-                'maxDuration': trip.maxDuration,
-                'maxPrice': trip.maxPrice,
-                'maxStops': trip.maxStops,
-                'originationAirportCode': trip.originationAirportCode,
-                'returnDate': trip.returnDate,
-                'returnTimeOfDay': trip.returnTimeOfDay,
-                'specificFlights': trip.specificFlights,
-                'type': trip.type,
-            }, f, indent=2)
-    
-    def appendCsvHistory(self, trip, flights, depart):
-        trip_name = trip.description.split('/')[-1]
-        file_path = os.path.join(self.config.tripsDir, f"{trip_name}.csv")
-        df = pd.read_csv(file_path)
-        df_flights = pd.DataFrame(flights)
-        df_flights['returnOrDepart'] = 'depart' if depart else 'return'
-        df_flights['query_datetime'] = self.now()
-        df = pd.concat([df, df_flights]) 
-        df.to_csv(file_path, index=False)
-            
-
     def sendNotification(self, index, message):
 
         if index is None:
             return
 
-        subject = self.config.trips[index].description + ": " + message
-        # print(self.now() + ": SENDING NOTIFICATION!!! '" + subject + "'")
-        print(f"{self.now()}: {subject}")
+        # Notification history and log files are shared, so only one worker may notify at a time
+        with self.lock:
+            subject = self.config.trips[index].description + ": " + message
+            # print(self.now() + ": SENDING NOTIFICATION!!! '" + subject + "'")
+            print(f"{self.now()}: {subject}")
 
-        if not self.states[index].notificationHistory:
-            # If in here, this is the first notification, so add details to notification and see if history is enabled
-            self.states[index].notificationHistory = self.initializeLogs(index)
-            self.appendLogFile(index, self.now() + ": Monitoring started")
-            self.states[index].notificationHistory = self.now() + ": Monitoring started" + os.linesep + self.states[index].notificationHistory
+            if not self.states[index].tripDetails:
+                # If in here, this is the first notification, so add details to notification and see if history is enabled
+                self.initializeLogs(index)
+                self.appendLogFile(index, self.now() + ": Monitoring started")
+                self.states[index].notificationHistory.appendleft(self.now() + ": Monitoring started")
 
-        shortMessage = self.now() + ": " + message
-        self.states[index].notificationHistory = shortMessage + os.linesep + self.states[index].notificationHistory
-        self.appendLogFile(index, shortMessage)
-
-        if self.config.notification.type == 'smtp':
-            try:
-                    # importing this way keeps people who aren't interested in smtplib from installing it..
-                smtplib = __import__('smtplib')
-                if self.config.notification.useAuth:
-                    server = smtplib.SMTP(self.config.notification.host, self.config.notification.port)
-                    server.ehlo()
-                    server.starttls()
-                    server.login(self.config.notification.username, self.config.notification.password)
-                else:
-                    server = smtplib.SMTP(self.config.notification.host, self.config.notification.port)
-
-                mailMessage = """From: %s\nTo: %s\nX-Priority: 2\nSubject: %s\n\n""" % (self.config.notification.sender, self.config.notification.recipient, subject)
-                mailMessage += self.states[index].notificationHistory
-
-                server.sendmail(self.config.notification.sender, self.config.notification.recipient, mailMessage)
-                server.quit()
-                print(self.now() + ": SENDING NOTIFICATION!!! '" + subject + "'")
-
-            except Exception as e:
-                print(self.now() + ": UNABLE TO SEND NOTIFICATION DUE TO ERROR - " + str(e))
-            return
-        elif self.config.notification.type == 'twilio':
-            try:
-                    # importing this way keeps people who aren't interested in Twilio from installing it..
-                twilio = __import__('twilio.rest')
-
-                client = twilio.rest.Client(self.config.notification.accountSid, self.config.notification.authToken)
-                client.messages.create(to = self.config.notification.recipient, from_ = self.config.notification.sender, body = subject)
-                print(self.now() + ": SENDING NOTIFICATION!!! '" + subject + "'")
-            except Exception as e:
-                print(self.now() + ": UNABLE TO SEND NOTIFICATION DUE TO ERROR - " + str(e))
-            return
+            shortMessage = self.now() + ": " + message
+            self.states[index].notificationHistory.appendleft(shortMessage)
+            self.appendLogFile(index, shortMessage)
 
+            # Delivery happens in the background, so scraping doesn't wait on the mail relay/Twilio. Legs of
+            # flexible trips are only logged, their plan notifies about the cheapest combination instead
+            if self.config.trips[index].plan is None:
+                self.notifier.notify(subject, self.notificationSummary(index))
 
-    def findLowestFare(self, trip):
+    def findLowestFare(self, trip, departFlights, returnFlights, lowestFlights = None):
         """
         Filter for 
             - Specific flight numbers
             - Maximum number of stops
             - Maximum duration of segment
             - Maximum price
-        and then check for lowest price.
+        and then check for lowest price. lowestFlights are the result of the filtering if it was
+        already done for a batch of trips (see evaluateTrips)
         """
-        trip_name = trip.description.split('/')[-1]
-        file_path = os.path.join(self.config.tripsDir, f"{trip_name}.csv")
-        df = pd.read_csv(file_path)
-
-        # Now, see if looking for specificFlights - if this is set, all other rules do not matter...
-        specificFlights = []
-        if trip.specificFlights:
-            specificFlights = [x.strip() for x in trip.specificFlights.split(',')]
-
-        # if self.config.dailyAlerts:
-        #     if self.states[trip.index].dailyAlertDate != datetime.datetime.now().date():
-        #         if lowestFare:
-        #             self.sendNotification(trip.index, "Daily alert fare is $" + str(lowestFare))
-        #         else:
-        #             self.sendNotification(trip.index, "Daily alert fare that meets criteria is UNAVAILABLE")
-        #         self.states[trip.index].dailyAlertDate = datetime.datetime.now().date()
-
-    def processTrip(self, trip, driver):
+        tracker = self.fareTrackers[trip.index]
+        tracker.update(departFlights, returnFlights, lowestFlights)
+        lowestFare = tracker.lowestFare()
+
+        fareChanged = lowestFare != self.states[trip.index].currentLowestFare
+        if trip.plan is not None:
+            self.states[trip.index].currentLowestFare = lowestFare
+            return fareChanged
+
+        if fareChanged:
+            if lowestFare is None:
+                self.sendNotification(trip.index, "Fare that meets criteria is UNAVAILABLE")
+            elif self.states[trip.index].currentLowestFare is None:
+                self.sendNotification(trip.index, "Fare is $" + str(lowestFare) + " (" + tracker.describe() + ")")
+            else:
+                self.sendNotification(trip.index, "Fare changed from $" + str(self.states[trip.index].currentLowestFare) + \
+                    " to $" + str(lowestFare) + " (" + tracker.describe() + ")")
+            self.states[trip.index].currentLowestFare = lowestFare
+
+        if self.config.dailyAlerts:
+            if self.states[trip.index].dailyAlertDate != datetime.datetime.now().date():
+                if lowestFare:
+                    self.sendNotification(trip.index, "Daily alert fare is $" + str(lowestFare))
+                else:
+                    self.sendNotification(trip.index, "Daily alert fare that meets criteria is UNAVAILABLE")
+                self.states[trip.index].dailyAlertDate = datetime.datetime.now().date()
+
+        return fareChanged
+
+    def updatePlan(self, plan, index):
+
+        with self.lock:
+            # Wait until every leg has been queried once, otherwise the cheapest combination would
+            # be reported repeatedly while the legs are first filled in
+            plan.pending.discard(index)
+            if plan.pending:
+                return
+
+            # Legs no longer queried (eg: their date has passed) are left out, rather than offering their last known fare
+            matrix = plan.matrix(dict((key, None if self.states[leg.index].blockQuery else self.fareTrackers[leg.index].lowestFare())
+                for key, leg in plan.legsByKey.items()))
+            lowestFare = None if matrix.empty else int(matrix['total'].iloc[0])
+            if lowestFare == plan.currentLowestFare:
+                return
+            plan.currentLowestFare = lowestFare
+
+            if lowestFare is None:
+                subject = plan.description + ": Fare that meets criteria is UNAVAILABLE"
+            else:
+                cheapest = matrix.iloc[0]
+                subject = plan.description + ": Cheapest is $" + str(lowestFare) + " " + cheapest['origin'] + "-" + cheapest['destination'] + \
+                    " departing " + cheapest['departureDate'] + ((" returning " + cheapest['returnDate']) if cheapest['returnDate'] else "")
+            print(f"{self.now()}: {subject}")
+            self.notifier.notify(subject, matrix.head(self.config.notificationSummaryLength).to_string(index = False))
+
+    def loadCheckpoint(self):
+        """
+        Restores trips and plans saved by a previous run and schedules every trip: restored trips
+        when they were next due, new ones straight away. Returns the number of trips restored
+        """
+        saved = {'trips': {}, 'plans': {}}
+        if self.config.stateFile:
+            self.stateJournal = checkpoint.journal(self.config.stateFile)
+            saved = self.stateJournal.load()
+
+        restored = 0
+        for trip in self.config.trips:
+            tripState = saved['trips'].get(checkpoint.tripKey(trip))
+            if tripState is None:
+                self.scheduler.schedule(trip.index)
+                continue
+
+            self.states[trip.index].restore(tripState['state'])
+            if tripState['state']['started']:
+                # "Monitoring started" was already logged and notified
+                self.states[trip.index].tripDetails = self.describeTrip(trip.index)
+            self.fareTrackers[trip.index].restore(tripState['fares'])
+            self.scheduler.resume(trip.index, tripState['schedule'])
+            if trip.plan is not None:
+                trip.plan.pending.discard(trip.index)
+            restored += 1
+
+        for plan in self.config.plans:
+            planState = saved['plans'].get(checkpoint.planKey(plan))
+            if planState is not None:
+                plan.currentLowestFare = planState['currentLowestFare']
+
+        return restored
+
+    def saveCheckpoint(self, trip):
+        """Saves the state of a trip (and its plan) after it was queried"""
+        if not self.config.stateFile:
+            return
+
+        # Only the state is read under the lock; the journal serializes and writes it outside of it
+        with self.lock:
+            stamp = next(self.checkpointStamps)
+            trips = {checkpoint.tripKey(trip): {
+                'state': self.states[trip.index].checkpoint(),
+                'fares': self.fareTrackers[trip.index].checkpoint(),
+                'schedule': self.scheduler.checkpoint(trip.index)
+            }}
+            plans = {checkpoint.planKey(trip.plan): {'currentLowestFare': trip.plan.currentLowestFare}} if trip.plan is not None else {}
+        try:
+            self.stateJournal.save(stamp, trips, plans)
+        except (IOError, OSError) as e:
+            print(self.now() + ": Unable to save state to '" + self.config.stateFile + "': " + str(e))
+
+    def processTrip(self, trip, backend):
+        """Returns (departFlights, returnFlights) if the trip was scraped, for evaluateTrips"""
+
+        # Phase timings from swa.scrape are collected by the selenium backend
+        scrapeTimings = getattr(backend, 'timings', None)
+        if scrapeTimings is not None:
+            scrapeTimings.clear()
+
+        timings = {}
+        with self.metrics.span('total', timings, trip = trip.description):
+            outcome, flights = self.scrapeTrip(trip, backend, timings)
+
+        for phase, seconds in (scrapeTimings or {}).items():
+            self.metrics.observe(phase, seconds, trip = trip.description)
+            timings[phase] = seconds
+
+        self.metrics.count('scrapes', trip = trip.description, outcome = outcome)
+        if outcome in OUTCOME_COUNTERS:
+            self.metrics.count(OUTCOME_COUNTERS[outcome], trip = trip.description)
+        # Page statistics (eg: how often the results never settled and the page was reloaded) are
+        # counted by swa across all trips
+        for name, total in swa.statisticsSnapshot().items():
+            self.metrics.total('page' + name[0].upper() + name[1:], total)
+        self.metrics.log({'time': self.now(), 'trip': trip.description, 'outcome': outcome, 'timings': timings})
+        self.metrics.export()
+        return flights
+
+    def scrapeTrip(self, trip, backend, timings):
         print(f"{self.now()}: Querying flight for {trip.description}")
 
         try:
-            departFlights, returnFlights = swa.scrape(
-                driver = driver,
-                originationAirportCode = trip.originationAirportCode,
-                destinationAirportCode = trip.destinationAirportCode,
-                departureDate = trip.departureDate,
-                departureTimeOfDay = trip.departureTimeOfDay,
-                returnDate = trip.returnDate,
-                returnTimeOfDay = trip.returnTimeOfDay,
-                tripType = trip.type,
-                adultPassengersCount = trip.adultPassengersCount,
-                debug = self.config.debug
-            )
+            with self.metrics.span('scrape', timings, trip = trip.description):
+                departFlights, returnFlights = self.resultCache.scrape(backend, {
+                    'originationAirportCode': trip.originationAirportCode,
+                    'destinationAirportCode': trip.destinationAirportCode,
+                    'departureDate': trip.departureDate,
+                    'departureTimeOfDay': trip.departureTimeOfDay,
+                    'returnDate': trip.returnDate,
+                    'returnTimeOfDay': trip.returnTimeOfDay,
+                    'tripType': trip.type,
+                    'adultPassengersCount': trip.adultPassengersCount
+                })
         except swa.scrapeValidation as e:
             print(e)
             print("\nValidation errors are not retryable, so swatcher is exiting")
             self.states[trip.index].blockQuery = True
-            return
+            return 'validation', None
         except swa.scrapeDatesNotOpen as e:
             self.sendNotification(trip.index, "Dates do not appear open / SWA detected Selenium")
-            return
+            self.scheduler.success(trip.index)
+            return 'datesNotOpen', None
         except swa.scrapeDatePast as e:
             self.sendNotification(trip.index, "Stopping trip monitoring as date has (or is about to) pass")
             self.states[trip.index].blockQuery = True
-            return
+            return 'datePast', None
+        except jobqueue.jobWaitTimeout as e:
+            print(self.now() + ": " + str(e) + ", will retry next loop")
+            self.scheduler.failure(trip.index)
+            return 'queueTimeout', None
+        except ratelimit.circuitOpen as e:
+            # Not a problem with the trip, so it's just queried again once SWA may be accepting queries
+            print(self.now() + ": " + str(e) + ", " + trip.description + " will be queried later")
+            self.scheduler.schedule(trip.index, e.retryIn)
+            return 'circuitOpen', None
         except swa.scrapeTimeout as e:
             # This could be a few things - internet or SWA website is down.
             # it could also mean my WebDriverWait conditional is incorrect/changed. Don't know
             # what to do about this, so for now, just print to screen and try again at next loop
             print(self.now() + ": Timeout waiting for results, will retry next loop")
-            return
+            self.scheduler.failure(trip.index)
+            return 'timeout', None
+        except backends.browserFault as e:
+            # A browser that crashed or hung isn't a problem with the trip, so doesn't count towards blocking it
+            print(self.now() + ": " + str(e) + ", it will be restarted before the next query")
+            self.scheduler.failure(trip.index)
+            return 'browserFault', None
         except Exception as e:
             print(e)
             self.states[trip.index].errorCount += 1
             if self.states[trip.index].errorCount == 3:
                 self.states[trip.index].blockQuery = True
                 self.sendNotification(trip.index, "Ceasing queries due to frequent errors")
-            return
-        
-        # Successfully scraped data
-        self.states[trip.index].blockQuery = True
+            else:
+                self.scheduler.failure(trip.index)
+            return 'error', None
+
+        # Only consecutive errors block a trip
+        self.states[trip.index].errorCount = 0
+        self.metrics.gauge('flightsParsed', len(departFlights) + len(returnFlights), trip = trip.description)
 
         # Save flight data
-        self.initializeCsvHistory(trip)
-        self.appendCsvHistory(trip, departFlights, depart=True)
-        self.appendCsvHistory(trip, returnFlights, depart=False)
+        with self.metrics.span('history', timings, trip = trip.description), self.lock:
+            self.history.initialize(trip)
+            self.history.append(trip, self.now(), departFlights, returnFlights)
+        self.metrics.count('historyRows', len(departFlights) + len(returnFlights), trip = trip.description)
+
+        # The fares are checked (and the trip rescheduled) by evaluateTrips, along with other trips scraped at the same time
+        return 'success', (departFlights, returnFlights)
 
-    def processTrips(self, driver):
+    def processTrips(self, backend):
         for trip in self.config.trips:
-            if not self.processTrip(trip, driver):
+            if not self.processTrip(trip, backend):
                 return False
 
         allBlocked = True
@@ -255,6 +416,44 @@ class swatcher(object):
 
         return True
 
+    def processTripWorker(self, trip):
+        """Scrapes a trip in a worker thread, returning what processTrip does"""
+        if self.queueBackends:
+            # Scraped by a worker process, this thread just waits for the result
+            return self.processTrip(trip, self.queueBackends[trip.backend])
+        elif trip.backend == 'http':
+            # The HTTP backend's session is safe to share, so it doesn't need to be checked out
+            return self.processTrip(trip, self.httpBackend)
+        else:
+            # A browser is only checked out if the query isn't answered by the result cache
+            return self.processTrip(trip, self.browserPool)
+
+    def browserReleased(self, backend):
+        if self.metrics.enabled:
+            self.metrics.gauge('browserMemory', browser.browserMemory(backend.driver), worker = backend.name)
+
+    def evaluateTrips(self, results):
+        """
+        Checks the fares of trips scraped at the same time ({trip.index: (departFlights, returnFlights)})
+        in one batch, then notifies about and reschedules each of them
+        """
+        with self.metrics.span('fareCheck'):
+            lowestFlights = self.evaluator.evaluate(results)
+
+        for index, (departFlights, returnFlights) in results.items():
+            fareChanged = self.findLowestFare(self.config.trips[index], departFlights, returnFlights, lowestFlights[index])
+            # Successfully scraped data, so check again after the poll interval
+            self.scheduler.success(index, fareChanged)
+
+    def finishTrip(self, trip):
+        if trip.plan is not None:
+            self.updatePlan(trip.plan, trip.index)
+
+        self.saveCheckpoint(trip)
+
+    def createDriver(self):
+        return browser.createDriver(self.config.browser, self.config.browserProfile, self.config.blockedUrls)
+
     def main(self):
 
         args = self.parseArguments()
@@ -266,36 +465,225 @@ class swatcher(object):
             print("Error in processing configuration file: " + str(e))
             quit()
 
-        self.states = [State() for i in range(len(self.config.trips))]
-
-        if self.config.browser.type == 'chrome': # Or Chromium
-            options = selenium.webdriver.ChromeOptions()
-            # options.add_argument('headless')
-            options.add_experimental_option("excludeSwitches", ['enable-automation'])
-            options.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.87 Safari/537.36")
-            options.add_argument("--remote-debugging-port=9222")
-            options.add_argument("log-level=" + str(self.config.browser.logLevel))
-            service = selenium.webdriver.chrome.service.Service(executable_path=self.config.browser.binaryLocation)
-            driver = selenium.webdriver.Chrome(service=service, options=options)
-            driver.minimize_window()
-        elif self.config.browser.type == 'firefox': # Or Iceweasel
-            options = selenium.webdriver.firefox.options.Options()
-            options.binary_location = self.config.browser.binaryLocation
-            options.add_argument('--headless')
-            driver = selenium.webdriver.Firefox(firefox_options = options)
+        if args.command == 'worker':
+            self.work()
+            return
+
+        self.states = [State(self.config.historyLength) for i in range(len(self.config.trips))]
+        self.metrics = metrics.registry(self.config.metricsFile, self.config.metricsLog)
+        self.notifier = notifier.dispatcher(self.config.notification, self.config.notificationDigestWindow, self.metrics)
+        self.notifier.start()
+        self.fareTrackers = [fares.fareTracker(trip) for trip in self.config.trips]
+        self.evaluator = fares.batchEvaluator(self.config.trips)
+        for plan in self.config.plans:
+            plan.pending = set(leg.index for leg in plan.legs)
+        if self.config.historyStore == 'sqlite':
+            self.history = history.sqliteHistory(self.config.historyDatabase)
+        elif self.config.historyStore == 'delta':
+            self.history = history.deltaHistory(self.config.tripsDir, self.config.snapshotInterval)
         else:
-            print("Unsupported web browser '" + browser.type + "' specified")
-            quit()
+            self.history = history.csvHistory(self.config.tripsDir)
+
+        # Shared by every backend, so the limits on querying SWA apply across all workers
+        governor = ratelimit.governor(self.config.requestRate, self.config.requestBurst,
+            self.config.breakerThreshold, self.config.breakerWindow, self.config.breakerCooldown)
+
+        browsers = queue.Queue()
+        if self.config.queue.database:
+            # Trips are scraped by worker processes, so no browsers are started here
+            self.jobQueue = jobqueue.jobQueue(self.config.queue.database, self.config.queue.leaseTime, self.config.queue.maxAttempts)
+            self.queueBackends = dict((backend, backends.queueBackend(self.jobQueue, backend, self.config.queue.jobTimeout, governor)) for backend in ['selenium', 'http'])
+            print(f"{self.now()}: Sending queries to workers through '{self.config.queue.database}'")
+        else:
+            self.createBackends(browsers, governor)
 
+        self.resultCache = cache.resultCache(self.config.cacheTTL, self.config.cacheSize)
+        self.scheduler = scheduler.scheduler(self.config.trips, self.config.pollInterval, self.config.pollJitter)
+        restored = self.loadCheckpoint()
+        if restored:
+            print(f"{self.now()}: Resuming {restored} trips from '{self.config.stateFile}'")
 
-        # Stops when all queries have been blocked
-        while not all([s.blockQuery for s in self.states]):
-            for trip in self.config.trips:
-                if not self.states[trip.index].blockQuery:
-                    self.processTrip(trip, driver)
+        if args.profileFile:
+            self.profilePass(args.profileFile)
+        else:
+            self.run()
+
+        self.closeBackends(browsers)
+        self.notifier.stop()
 
         print(f"{self.now()}: Completed scrape")
 
+    def createBackends(self, browsers, governor = None):
+
+        # Each worker owns its own browser, handed out through a queue so a browser is only used by one trip at a time
+        if any(trip.backend == 'selenium' for trip in self.config.trips):
+            try:
+                for workerIndex in range(self.config.workers):
+                    browsers.put(backends.seleniumBackend(self.createDriver(), self.config.extraction, self.config.debug, "worker-" + str(workerIndex), governor))
+            except Exception as e:
+                print(str(e))
+                quit()
+            self.driverManager = browser.driverManager(self.createDriver, self.config.maxPageLoads, self.config.maxBrowserMemory, self.config.spareBrowsers)
+            self.browserPool = backends.browserPool(browsers, self.driverManager, self.browserReleased)
+
+        if any(trip.backend == 'http' for trip in self.config.trips):
+            self.httpBackend = backends.httpBackend(
+                url = self.config.http.url or swa.API_URL,
+                apiKey = self.config.http.apiKey,
+                poolSize = self.config.http.poolSize,
+                debug = self.config.debug,
+                governor = governor
+            )
+
+    def closeBackends(self, browsers):
+        while not browsers.empty():
+            browsers.get().close()
+        if self.driverManager:
+            self.driverManager.close()
+        if self.httpBackend:
+            self.httpBackend.close()
+
+    def work(self):
+        """
+        Runs as a worker: each of the configured workers claims jobs from the queue, scrapes them and
+        writes back the results, until interrupted. The trips in the configuration file only decide
+        which backends (browsers and/or HTTP) are started, so use the same file as the coordinator
+        """
+        if not self.config.queue.database:
+            print("Worker mode needs a [queue] database to take jobs from")
+            quit()
+
+        jobBackends = sorted(set(trip.backend for trip in self.config.trips))
+        if not jobBackends:
+            print("There are no trips in the configuration file, so no backends to scrape jobs with")
+            quit()
+
+        self.jobQueue = jobqueue.jobQueue(self.config.queue.database, self.config.queue.leaseTime, self.config.queue.maxAttempts)
+        browsers = queue.Queue()
+        # The coordinator applies the rate limit and circuit breaker when it queues jobs
+        self.createBackends(browsers)
+
+        name = jobqueue.workerName()
+        print(f"{self.now()}: Worker {name} taking jobs from '{self.config.queue.database}'")
+
+        stopping = threading.Event()
+        threads = [threading.Thread(target = self.workLoop, args = (name + '/' + str(i), jobBackends, stopping), daemon = True)
+            for i in range(self.config.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print(f"{self.now()}: Stopping once current jobs are finished")
+            stopping.set()
+            for thread in threads:
+                thread.join()
+
+        self.closeBackends(browsers)
+
+    def workLoop(self, owner, jobBackends, stopping):
+        while not stopping.is_set():
+            try:
+                job = self.jobQueue.claim(owner, jobBackends)
+            except Exception as e:
+                print(self.now() + ": Unable to claim a job: " + str(e))
+                job = None
+            if job is None:
+                stopping.wait(1)
+                continue
+
+            jobId, backend, query = job
+            print(f"{self.now()}: {owner} querying job {jobId} ({query['originationAirportCode']}-{query['destinationAirportCode']} {query['departureDate']})")
+            try:
+                departFlights, returnFlights = (self.httpBackend if backend == 'http' else self.browserPool).scrape(**query)
+            except Exception as e:
+                print(self.now() + ": Job " + str(jobId) + " failed: " + str(e))
+                self.finishJob(jobId, owner, error = e)
+                continue
+
+            self.finishJob(jobId, owner, (departFlights, returnFlights))
+
+    def finishJob(self, jobId, owner, flights = None, error = None):
+        try:
+            if error is not None:
+                self.jobQueue.fail(jobId, owner, error)
+            elif not self.jobQueue.complete(jobId, owner, *flights):
+                print(self.now() + ": Job " + str(jobId) + " was reassigned after its lease expired, discarding results")
+        except Exception as e:
+            # Eg: the database stayed locked. The job's lease will expire and it will be handed out again
+            print(self.now() + ": Unable to record the result of job " + str(jobId) + ": " + str(e))
+
+    def profilePass(self, profileFile):
+        import cProfile
+
+        # cProfile only sees the thread it runs in, so the trips are queried one after another here
+        profiler = cProfile.Profile()
+        profiler.enable()
+        results = {}
+        for trip in self.config.trips:
+            flights = self.processTripWorker(trip)
+            if flights is not None:
+                results[trip.index] = flights
+        self.evaluateTrips(results)
+        for trip in self.config.trips:
+            self.finishTrip(trip)
+        profiler.disable()
+        profiler.dump_stats(profileFile)
+        print(f"{self.now()}: Saved profile to '{profileFile}'")
+
+    def run(self):
+
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers = self.config.workers) as executor:
+            # Stops when all queries have been blocked
+            while not all([s.blockQuery for s in self.states]):
+                for index in self.scheduler.popDue():
+                    if not self.states[index].blockQuery:
+                        running[executor.submit(self.processTripWorker, self.config.trips[index])] = index
+
+                if not running and self.scheduler.empty():
+                    break
+
+                # Sleep until the next trip is due, waking early when a scrape completes since it will have rescheduled its trip
+                if running:
+                    done, notDone = concurrent.futures.wait(running, timeout = self.scheduler.timeUntilNext(), return_when = concurrent.futures.FIRST_COMPLETED)
+                    self.tripsFinished(dict((future, running.pop(future)) for future in done))
+                else:
+                    time.sleep(self.scheduler.timeUntilNext())
+
+    def tripsFinished(self, finished):
+        """
+        Handles the trips whose scrapes finished ({future: trip.index}). Their fares are evaluated together,
+        so when several workers finish at once (or many trips share a cached result), it's one batch
+        """
+        results = {}
+        for future, index in finished.items():
+            if future.exception() is not None:
+                self.tripError(index, future.exception())
+            elif future.result() is not None:
+                results[index] = future.result()
+
+        try:
+            if results:
+                self.evaluateTrips(results)
+        except Exception as e:
+            for index in results:
+                self.tripError(index, e)
+
+        for index in finished.values():
+            try:
+                self.finishTrip(self.config.trips[index])
+            except Exception as e:
+                self.tripError(index, e)
+
+    def tripError(self, index, error):
+        print(self.now() + ": Unexpected error processing " + self.config.trips[index].description + ": " + repr(error))
+        traceback.print_exception(type(error), error, error.__traceback__)
+        # Keep monitoring the trip, unless it was already rescheduled before the error
+        if not self.scheduler.isScheduled(index):
+            self.scheduler.failure(index)
+
 if __name__ == "__main__":
     swatcher = swatcher()
     swatcher.main()
@@ -0,0 +1,21 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def readFixture(name):
+    with open(os.path.join(FIXTURES, name), encoding = 'utf-8') as fixture:
+        return fixture.read()
+
+@pytest.fixture
+def trip():
+    # The settings of a [trip-N] section, as read by configuration.py
+    return types.SimpleNamespace(index = 0, description = 'MDW to MCO', plan = None, type = 'roundtrip',
+        originationAirportCode = 'MDW', destinationAirportCode = 'MCO', departureDate = '2026-12-04', returnDate = '2026-12-08',
+        departureTimeOfDay = 'ALL_DAY', returnTimeOfDay = 'ALL_DAY', adultPassengersCount = 1,
+        maxStops = 1, maxDuration = 0, maxPrice = 0, specificFlights = '')
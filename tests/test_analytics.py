@@ -0,0 +1,54 @@
+import pytest
+
+import analytics
+import history
+
+def flight(number, fare):
+    return {'flight': number, 'departTime': '6:05AM', 'arriveTime': '9:50AM', 'duration': 2.75, 'stops': 0,
+        'fare': fare, 'fareAnytime': 400, 'fareBusinessSelect': None}
+
+def scrape(store, trip, queryDatetime, departFare, returnFare):
+    store.append(trip, queryDatetime, [flight('1234', departFare), flight('876', 250)], [flight('553', returnFare)])
+
+def outputs(trip, directory):
+    results = analytics.tripAnalytics(history.csvHistory(directory).fileName(trip), str(directory / 'analytics'))
+    return results.events(), results.lowest(), results.daily(), results.departureCurve()
+
+def test_interruptedUpdate(tmp_path, trip, monkeypatch):
+    store = history.csvHistory(str(tmp_path))
+    store.initialize(trip)
+    analyticsDir = str(tmp_path / 'analytics')
+
+    scrape(store, trip, '2026-10-01 08:00:00', 130, 149)
+    scrape(store, trip, '2026-10-01 09:00:00', 119, 149)
+    analytics.tripAnalytics(store.fileName(trip), analyticsDir).update()
+
+    scrape(store, trip, '2026-10-02 08:00:00', 109, None)
+    scrape(store, trip, '2026-10-03 08:00:00', 129, 139)
+
+    # Interrupted after appending to the outputs, but before the state was saved
+    writeAtomic = history.writeAtomic
+    def interrupted(fileName, text):
+        if fileName.endswith('state.json'):
+            raise KeyboardInterrupt()
+        writeAtomic(fileName, text)
+    monkeypatch.setattr(history, 'writeAtomic', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        analytics.tripAnalytics(store.fileName(trip), analyticsDir).update()
+    monkeypatch.setattr(history, 'writeAtomic', writeAtomic)
+
+    # The partial rows are left out until the update is redone, then show up once
+    partial = analytics.tripAnalytics(store.fileName(trip), analyticsDir)
+    assert len(partial.lowest()) == 4
+    assert partial.update() == 6
+
+    rebuilt = tmp_path / 'rebuilt'
+    rebuiltStore = history.csvHistory(str(rebuilt))
+    rebuiltStore.initialize(trip)
+    with open(store.fileName(trip)) as historyFile, open(rebuiltStore.fileName(trip), 'w') as rebuiltFile:
+        rebuiltFile.write(historyFile.read())
+    analytics.tripAnalytics(rebuiltStore.fileName(trip), str(rebuilt / 'analytics')).update()
+
+    for redone, expected in zip(outputs(trip, tmp_path), outputs(trip, rebuilt)):
+        assert redone.equals(expected)
+    assert len(outputs(trip, tmp_path)[1]) == 8
@@ -0,0 +1,131 @@
+import queue
+import types
+import threading
+
+import pytest
+
+import swa
+import cache
+import browser
+import backends
+import ratelimit
+
+QUERY = {'originationAirportCode': 'MDW', 'destinationAirportCode': 'MCO', 'departureDate': '2026-12-04', 'returnDate': '', 'tripType': 'oneway'}
+
+class fakeDriver(object):
+
+    def __init__(self):
+        self.alive = True
+
+    def execute_script(self, script):
+        if not self.alive:
+            raise Exception("Browser crashed")
+        return 1
+
+    def quit(self):
+        pass
+
+class fakeBackend(object):
+    # Stands in for a seleniumBackend, answering scrapes with result (or raising it)
+
+    def __init__(self, result = None):
+        self.name = 'worker-0'
+        self.driver = fakeDriver()
+        self.timings = {}
+        self.result = result
+        self.crash = False
+        self.scrapes = 0
+        self.started = threading.Event()
+        self.finish = threading.Event()
+        self.finish.set()
+
+    def scrape(self, **query):
+        self.scrapes += 1
+        self.started.set()
+        self.finish.wait()
+        self.timings['load'] = 1.0
+        if self.crash:
+            self.driver.alive = False
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result or ([{'flight': '1234'}], [])
+
+@pytest.fixture
+def pool():
+    browsers = queue.Queue()
+    backend = fakeBackend()
+    browsers.put(backend)
+    manager = browser.driverManager(fakeDriver, maxPageLoads = 100, spares = 0)
+    released = []
+    yield types.SimpleNamespace(browsers = browsers, backend = backend, manager = manager, released = released,
+        pool = backends.browserPool(browsers, manager, released.append))
+    manager.close()
+
+def pageLoads(pool):
+    return pool.manager.pageLoads.get(id(pool.backend.driver), 0)
+
+def test_pageLoadsCounted(pool):
+    assert pool.pool.scrape(**QUERY) == ([{'flight': '1234'}], [])
+    assert pool.pool.timings == {'load': 1.0}
+    assert pageLoads(pool) == 1
+    assert pool.released == [pool.backend]
+    assert pool.browsers.qsize() == 1
+
+def test_cacheHitsDontCheckOutBrowsers(pool):
+    results = cache.resultCache(ttl = 60)
+    results.scrape(pool.pool, QUERY)
+
+    # Hold the only browser, then query again: answered by the cache without waiting for it
+    held = pool.browsers.get()
+    try:
+        assert results.scrape(pool.pool, QUERY) == ([{'flight': '1234'}], [])
+    finally:
+        pool.browsers.put(held)
+    assert pool.backend.scrapes == 1
+    assert pageLoads(pool) == 1
+
+def test_coalescedQueriesLoadOnce(pool):
+    results = cache.resultCache(ttl = 60)
+    pool.backend.finish.clear()
+    answers = []
+    threads = [threading.Thread(target = lambda: answers.append(results.scrape(pool.pool, QUERY))) for i in range(3)]
+    threads[0].start()
+    pool.backend.started.wait(1)
+    for thread in threads[1:]:
+        thread.start()
+    pool.backend.finish.set()
+    for thread in threads:
+        thread.join(1)
+
+    assert len(answers) == 3
+    assert pool.backend.scrapes == 1
+    assert pageLoads(pool) == 1
+
+def test_circuitOpenIsNotAPageLoad(pool):
+    pool.backend.result = ratelimit.circuitOpen(60)
+    with pytest.raises(ratelimit.circuitOpen):
+        pool.pool.scrape(**QUERY)
+    assert pageLoads(pool) == 0
+    assert pool.released == []
+
+def test_browserFault(pool):
+    # A scrape error from a browser that stopped responding is a browser fault, not a problem with the query
+    pool.backend.result = swa.scrapeGeneral("Something went wrong")
+    pool.backend.crash = True
+    with pytest.raises(backends.browserFault):
+        pool.pool.scrape(**QUERY)
+
+    # It's replaced before the next scrape
+    pool.backend.result = None
+    pool.backend.crash = False
+    assert pool.pool.scrape(**QUERY) == ([{'flight': '1234'}], [])
+    assert pool.backend.driver.alive
+    assert pool.manager.restarts == 1
+
+def test_browserRestartFails(pool):
+    pool.backend.driver.alive = False
+    pool.manager.factory = lambda: (_ for _ in ()).throw(Exception("No browser"))
+    with pytest.raises(backends.browserFault, match = 'could not be restarted'):
+        pool.pool.scrape(**QUERY)
+    assert pool.backend.scrapes == 0
+    assert pool.browsers.qsize() == 1
@@ -0,0 +1,59 @@
+import datetime
+
+import swa
+
+from conftest import readFixture
+
+def calendarFixture():
+    return readFixture('calendar.html')
+
+def test_parseCalendarHtml():
+    calendars = swa.parseCalendarHtml(calendarFixture(), '2026-12')
+
+    assert len(calendars) == 2
+    departFares, returnFares = calendars
+    # Padding days before the 1st and after the 31st are skipped
+    assert list(departFares.keys()) == ['2026-12-%02d' % day for day in range(1, 32)]
+    assert list(departFares.items())[:6] == [('2026-12-01', 129), ('2026-12-02', 98), ('2026-12-03', None),
+        ('2026-12-04', 59), ('2026-12-05', None), ('2026-12-06', 212)]
+    assert list(returnFares.items())[:6] == [('2026-12-01', 149), ('2026-12-02', None), ('2026-12-03', 77),
+        ('2026-12-04', 77), ('2026-12-05', None), ('2026-12-06', 301)]
+
+def drillDown(monkeypatch, maxPrice, firstDay = datetime.date(2026, 12, 1)):
+    calendars = swa.parseCalendarHtml(calendarFixture(), '2026-12')
+    monkeypatch.setattr(swa, 'scrapeCalendar', lambda *args: (calendars[0], calendars[1]))
+    # As if tomorrow were firstDay
+    monkeypatch.setattr(swa, 'validateMonth', lambda month: (firstDay, datetime.date(2026, 12, 31)))
+    scraped = []
+    def scrape(driver, origin, destination, date, returnDate, **options):
+        scraped.append((origin, date))
+        return [{'date': date}], []
+    monkeypatch.setattr(swa, 'scrape', scrape)
+
+    return scraped, swa.scrapeCalendarDrillDown(None, 'MDW', 'MCO', '2026-12', maxPrice)
+
+def test_drillDownMaxPrice(monkeypatch):
+    scraped, (departFares, returnFares, departFlights, returnFlights) = drillDown(monkeypatch, 100)
+
+    assert scraped == [('MDW', '2026-12-02'), ('MDW', '2026-12-04'), ('MCO', '2026-12-03'), ('MCO', '2026-12-04')]
+    assert list(departFlights.keys()) == ['2026-12-02', '2026-12-04']
+    assert departFlights['2026-12-02'] == [{'date': '2026-12-02'}]
+    assert list(returnFlights.keys()) == ['2026-12-03', '2026-12-04']
+
+def test_drillDownUnlimited(monkeypatch):
+    # A maxPrice of 0 means no limit (as everywhere else), so every day with a fare is scraped
+    scraped, (departFares, returnFares, departFlights, returnFlights) = drillDown(monkeypatch, 0)
+
+    assert len(departFlights) == 29
+    assert len(returnFlights) == 29
+    assert '2026-12-03' not in departFlights
+    assert '2026-12-05' not in returnFlights
+
+def test_drillDownSkipsPastDays(monkeypatch):
+    # The calendar still shows the days of the month which are over, but they can't be scraped
+    scraped, (departFares, returnFares, departFlights, returnFlights) = drillDown(monkeypatch, 100, datetime.date(2026, 12, 4))
+
+    assert scraped == [('MDW', '2026-12-04'), ('MCO', '2026-12-04')]
+    assert '2026-12-02' in departFares
+    assert list(departFlights.keys()) == ['2026-12-04']
+    assert list(returnFlights.keys()) == ['2026-12-04']
@@ -0,0 +1,37 @@
+import random
+import types
+
+import fares
+
+def randomTrip(index):
+    return types.SimpleNamespace(index = index, type = random.choice(['roundtrip', 'oneway']), maxStops = random.choice([0, 1, 2]),
+        maxDuration = random.choice([0, 3.5, 4.17, 6]), maxPrice = random.choice([0, 100, 150, 200]),
+        specificFlights = random.choice(['', '', '1234, 876', '2211/745']))
+
+def randomFlights(count):
+    return [{'flight': random.choice(['1234', '876', '2211/745', str(random.randint(1, 3000))]), 'stops': random.randint(0, 2),
+        'duration': random.choice([2.75, 3.5, 4.17, 4.18, 5.5]), 'fare': random.choice([None, 59, 98, 100, 129, 150, 201])}
+        for i in range(count)]
+
+def test_batchEvaluatorMatchesTracker():
+    random.seed(9)
+    trips = [randomTrip(index) for index in range(200)]
+    results = dict((trip.index, (randomFlights(random.randint(0, 30)), randomFlights(random.randint(0, 30)) if trip.type == 'roundtrip' else []))
+        for trip in trips if random.random() < 0.9)
+
+    lowestFlights = fares.batchEvaluator(trips).evaluate(results)
+
+    assert set(lowestFlights) == set(results)
+    for index, (departFlights, returnFlights) in results.items():
+        tracker = fares.fareTracker(trips[index])
+        tracker.update(departFlights, returnFlights)
+        batchTracker = fares.fareTracker(trips[index])
+        batchTracker.update(departFlights, returnFlights, lowestFlights[index])
+        # The very same flights, so ties go to the same one
+        assert all(tracker.lowestFlights[leg] is batchTracker.lowestFlights[leg] for leg in tracker.legs)
+        assert tracker.lowestFare() == batchTracker.lowestFare()
+
+def test_batchEvaluatorEmpty():
+    trips = [randomTrip(0)]
+    assert fares.batchEvaluator(trips).evaluate({}) == {}
+    assert fares.batchEvaluator(trips).evaluate({0: ([], [])}) == {0: {'depart': None, 'return': None}}
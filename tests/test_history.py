@@ -0,0 +1,50 @@
+import history
+
+def flight(number, fare, departTime = '6:05AM'):
+    return {'flight': number, 'departTime': departTime, 'arriveTime': '9:50AM', 'duration': 2.75, 'stops': 0,
+        'fare': fare, 'fareAnytime': 400, 'fareBusinessSelect': None}
+
+def test_deltaReconstruct(tmp_path, trip):
+    store = history.deltaHistory(str(tmp_path), snapshotInterval = 3)
+    store.initialize(trip)
+
+    scrapes = [
+        ('2026-10-01 08:00:00', [flight('1234', 130), flight('876', 98)], [flight('553', 149)]),
+        ('2026-10-01 09:00:00', [flight('1234', 130), flight('876', 98)], [flight('553', 149)]), # Nothing changed
+        ('2026-10-01 10:00:00', [flight('1234', 119), flight('876', None)], [flight('553', 149)]), # Changes only
+        ('2026-10-01 11:00:00', [flight('876', 98), flight('1234', 119)], [flight('553', 149)]), # Reordered, so a snapshot
+        ('2026-10-01 12:00:00', [flight('876', 98), flight('1234', 109)], []), # Return flight gone
+        ('2026-10-01 13:00:00', [], []), # No flights at all
+        ('2026-10-01 14:00:00', [flight('876', 98, '7:00AM'), flight('1234', 109)], []),
+        ('2026-10-01 15:00:00', [flight('876', 99, '7:00AM'), flight('1234', 109)], []),
+        ('2026-10-01 16:00:00', [flight('876', 99, '7:00AM'), flight('1234', 109)], []),
+        ('2026-10-01 17:00:00', [flight('876', 99, '7:00AM'), flight('1234', 101)], []),
+        ('2026-10-01 18:00:00', [flight('876', 99, '7:00AM'), flight('1234', 95)], []), # snapshotInterval reached
+    ]
+    for queryDatetime, departFlights, returnFlights in scrapes:
+        store.append(trip, queryDatetime, departFlights, returnFlights)
+
+    assert store.reconstruct(trip, '2026-10-01 07:59:59') is None
+    for queryDatetime, departFlights, returnFlights in scrapes:
+        assert store.reconstruct(trip, queryDatetime) == (departFlights, returnFlights)
+    # Between scrapes, the flights are as of the previous scrape
+    assert store.reconstruct(trip, '2026-10-01 10:30:00') == (scrapes[2][1], scrapes[2][2])
+
+    # Only changed flights were written between snapshots
+    with open(store.fileName(trip)) as historyFile:
+        changes = [line.split(',')[-1].strip() for line in historyFile.readlines()[1:]]
+    assert changes == ['snapshot'] * 3 + ['changed'] * 2 + ['snapshot'] * 5 + ['empty'] + ['snapshot'] * 2 + ['changed'] * 2 + ['snapshot'] * 2
+
+def test_deltaRestart(tmp_path, trip):
+    store = history.deltaHistory(str(tmp_path))
+    store.initialize(trip)
+    store.append(trip, '2026-10-01 08:00:00', [flight('1234', 130)], [flight('553', 149)])
+    store.append(trip, '2026-10-01 09:00:00', [flight('1234', 120)], [flight('553', 149)])
+
+    # A new store (after a restart) doesn't know the previous flights, so starts with a snapshot
+    restarted = history.deltaHistory(str(tmp_path))
+    restarted.initialize(trip)
+    restarted.append(trip, '2026-10-01 10:00:00', [flight('1234', 110)], [flight('553', 149)])
+
+    assert restarted.reconstruct(trip, '2026-10-01 09:30:00') == ([flight('1234', 120)], [flight('553', 149)])
+    assert restarted.reconstruct(trip, '2026-10-01 10:00:00') == ([flight('1234', 110)], [flight('553', 149)])
@@ -0,0 +1,90 @@
+import json
+import datetime
+import threading
+import http.server
+
+import pytest
+
+import swa
+import backends
+
+from conftest import readFixture
+
+class stubHandler(http.server.BaseHTTPRequestHandler):
+    # Answers every POST with the server's recorded response, keeping the requests it was sent
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((dict(self.headers), json.loads(body)))
+        status, contentType, content = self.server.response
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stubServer():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), stubHandler)
+    server.requests = []
+    server.response = (200, 'application/json', readFixture('shopping.json').encode('utf-8'))
+    server.url = 'http://127.0.0.1:' + str(server.server_address[1]) + '/api/air-booking/v1/air-booking/page/air/booking/shopping'
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def futureDate(days):
+    return (datetime.date.today() + datetime.timedelta(days = days)).strftime('%Y-%m-%d')
+
+def query(**options):
+    query = {'originationAirportCode': 'MDW', 'destinationAirportCode': 'MCO',
+        'departureDate': futureDate(30), 'returnDate': futureDate(34), 'tripType': 'roundtrip'}
+    query.update(options)
+    return query
+
+def test_httpBackend(stubServer):
+    backend = backends.httpBackend(url = stubServer.url, apiKey = 'test-key')
+    try:
+        departFlights, returnFlights = backend.scrape(**query())
+    finally:
+        backend.close()
+
+    headers, payload = stubServer.requests[0]
+    assert headers['X-API-Key'] == 'test-key'
+    assert (payload['originationAirportCode'], payload['destinationAirportCode']) == ('MDW', 'MCO')
+    assert (payload['departureDate'], payload['returnDate']) == (futureDate(30), futureDate(34))
+    assert payload['adultPassengersCount'] == '1'
+
+    assert [flight['flight'] for flight in departFlights] == ['1234', '2211/745', '876']
+    assert departFlights[0] == {'flight': '1234', 'departTime': '6:05AM', 'arriveTime': '9:50AM', 'duration': 2.75,
+        'stops': 0, 'fare': 130, 'fareAnytime': 400, 'fareBusinessSelect': 460}
+    assert (departFlights[1]['stops'], departFlights[1]['duration'], departFlights[1]['fare']) == (1, 4.75, 98)
+    # Sold out and unavailable fares
+    assert (departFlights[2]['fare'], departFlights[2]['fareAnytime'], departFlights[2]['fareBusinessSelect']) == (None, 460, None)
+    assert [(flight['flight'], flight['departTime'], flight['fare']) for flight in returnFlights] == [('553', '7:15AM', 149), ('3310', '12:00PM', 78)]
+
+def test_oneway(stubServer):
+    session = swa.createSession()
+    departFlights, returnFlights = swa.scrapeHttp(session, url = stubServer.url, **query(returnDate = '', tripType = 'oneway'))
+
+    assert stubServer.requests[0][1]['tripType'] == 'oneway'
+    assert len(departFlights) == 3
+    assert returnFlights == []
+
+def test_datesNotOpen(stubServer):
+    # Errors come back as JSON notifications alongside a 4xx status
+    stubServer.response = (400, 'application/json', readFixture('shopping-not-open.json').encode('utf-8'))
+
+    with pytest.raises(swa.scrapeDatesNotOpen):
+        swa.scrapeHttp(swa.createSession(), url = stubServer.url, **query())
+
+def test_errorWithoutJson(stubServer):
+    stubServer.response = (503, 'text/html', b'<html><body>Service Unavailable</body></html>')
+
+    with pytest.raises(swa.scrapeGeneral, match = 'status 503'):
+        swa.scrapeHttp(swa.createSession(), url = stubServer.url, **query())
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+import swa
+import jobqueue
+
+QUERY = {'originationAirportCode': 'MDW', 'destinationAirportCode': 'MCO', 'departureDate': '2026-12-04', 'returnDate': '', 'tripType': 'oneway'}
+
+@pytest.fixture
+def jobs(tmp_path):
+    return jobqueue.jobQueue(str(tmp_path / 'jobs.db'), leaseTime = 0.1, maxAttempts = 2)
+
+def test_submitReusesOutstandingJob(jobs):
+    jobId = jobs.submit('selenium', QUERY)
+    assert jobs.submit('selenium', dict(reversed(list(QUERY.items())))) == jobId
+    assert jobs.submit('http', QUERY) != jobId
+
+    assert jobs.claim('worker-1') == (jobId, 'selenium', QUERY)
+    assert jobs.submit('selenium', QUERY) == jobId
+    assert jobs.complete(jobId, 'worker-1', [{'flight': '1234'}], [])
+    # Finished, so the next scrape of the query is a new job
+    assert jobs.submit('selenium', QUERY) != jobId
+
+def test_leaseExpiry(jobs):
+    jobId = jobs.submit('selenium', QUERY)
+    assert jobs.claim('worker-1')[0] == jobId
+    # Leased, so no other worker gets it until the lease expires
+    assert jobs.claim('worker-2') is None
+
+    time.sleep(0.15)
+    assert jobs.claim('worker-2')[0] == jobId
+    assert jobs.result(jobId) is None
+
+    # worker-1 lost its lease, so only worker-2's result is used
+    assert not jobs.complete(jobId, 'worker-1', [{'flight': 'stale'}], [])
+    assert jobs.complete(jobId, 'worker-2', [{'flight': '1234'}], [])
+    assert jobs.wait(jobId, 1) == ([{'flight': '1234'}], [])
+    # Everyone waiting on the job can read it
+    assert jobs.wait(jobId, 1) == ([{'flight': '1234'}], [])
+
+def test_leaseExpiryLastAttempt(jobs):
+    jobId = jobs.submit('selenium', QUERY)
+    for worker in ['worker-1', 'worker-2']:
+        assert jobs.claim(worker)[0] == jobId
+        time.sleep(0.15)
+
+    # The lease expired on the last attempt, so the job failed rather than going to another worker
+    assert jobs.claim('worker-3') is None
+    with pytest.raises(swa.scrapeGeneral, match = 'Lease expired 2 times'):
+        jobs.result(jobId)
+
+def test_failures(jobs):
+    jobId = jobs.submit('selenium', QUERY)
+    jobs.claim('worker-1')
+    # Retried after a delay
+    assert jobs.fail(jobId, 'worker-1', swa.scrapeGeneral("Browser crashed"))
+    assert jobs.counts() == {'pending': 1}
+    assert jobs.claim('worker-1') is None
+
+    # Answers (such as dates not being open) are passed back as the same error
+    jobId = jobs.submit('http', QUERY)
+    jobs.claim('worker-2', ['http'])
+    assert jobs.fail(jobId, 'worker-2', swa.scrapeDatesNotOpen("Not open"))
+    with pytest.raises(swa.scrapeDatesNotOpen):
+        jobs.result(jobId)
+
+def test_waitTimeout(jobs):
+    jobId = jobs.submit('selenium', QUERY)
+
+    # Workers being busy isn't a scrape timeout (which counts against SWA in the circuit breaker)
+    with pytest.raises(jobqueue.jobWaitTimeout):
+        jobs.wait(jobId, 0.1, interval = 0.05)
+    assert jobs.submit('selenium', QUERY) == jobId
@@ -0,0 +1,67 @@
+import socket
+import types
+
+import pytest
+
+import notifier
+
+aiosmtpd = pytest.importorskip('aiosmtpd.controller')
+
+class recordingHandler(object):
+    # Keeps every message the SMTP server accepts, along with the connection it came in on
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((session.peer, envelope.mail_from, envelope.rcpt_tos, envelope.content.decode('utf-8')))
+        return '250 Message accepted for delivery'
+
+def freePort():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+@pytest.fixture
+def smtpServer():
+    handler = recordingHandler()
+    controller = aiosmtpd.Controller(handler, hostname = '127.0.0.1', port = freePort())
+    controller.start()
+    yield types.SimpleNamespace(handler = handler, controller = controller)
+    controller.stop()
+
+def smtpConfig(smtpServer):
+    # The [smtp] section, as read by configuration.py
+    return types.SimpleNamespace(type = 'smtp', host = '127.0.0.1', port = smtpServer.controller.port,
+        useAuth = False, username = '', password = '', sender = 'swatcher@example.com', recipient = 'one@example.com, two@example.com')
+
+def test_smtpTransport(smtpServer):
+    transport = notifier.smtpTransport(smtpConfig(smtpServer))
+    transport.send("Fare dropped", "MDW to MCO is now $98", "Fare dropped")
+    transport.send("Fare rose", "MDW to MCO is now $129", "Fare rose")
+
+    # Reconnects if the connection was dropped
+    transport.server.sock.shutdown(socket.SHUT_RDWR)
+    transport.send("Fare dropped again", "MDW to MCO is now $89", "Fare dropped again")
+    transport.close()
+
+    messages = smtpServer.handler.messages
+    assert [message[2] for message in messages] == [['one@example.com', 'two@example.com']] * 3
+    assert 'Subject: Fare dropped\n' in messages[0][3].replace('\r\n', '\n')
+    assert 'MDW to MCO is now $89' in messages[2][3]
+    # The connection is kept open between notifications
+    assert messages[0][0] == messages[1][0]
+    assert messages[2][0] != messages[1][0]
+
+def test_dispatcherDigest(smtpServer):
+    dispatcher = notifier.dispatcher(smtpConfig(smtpServer), digestWindow = 0.5)
+    dispatcher.start()
+    dispatcher.notify("Fare dropped for MDW to MCO", "Now $98")
+    dispatcher.notify("Fare dropped for MCO to MDW", "Now $77")
+    dispatcher.stop()
+
+    # Sent together as one digest
+    assert len(smtpServer.handler.messages) == 1
+    content = smtpServer.handler.messages[0][3]
+    assert 'Subject: swatcher: 2 notifications' in content
+    assert 'Fare dropped for MDW to MCO\nNow $98' in content.replace('\r\n', '\n')
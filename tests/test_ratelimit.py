@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+import swa
+import ratelimit
+
+def test_breakerOpensAfterThreshold():
+    breaker = ratelimit.circuitBreaker(threshold = 3, window = 60, cooldown = 0.1)
+    for signal in range(2):
+        assert breaker.allow() is False
+        assert not breaker.signal(False)
+    assert breaker.state == 'closed'
+
+    assert breaker.signal(False)
+    assert breaker.state == 'open'
+    with pytest.raises(ratelimit.circuitOpen):
+        breaker.allow()
+
+def test_breakerWindow():
+    breaker = ratelimit.circuitBreaker(threshold = 2, window = 0.1, cooldown = 0.1)
+    breaker.signal(False)
+    time.sleep(0.15)
+    # The first signal is outside the window by now
+    assert not breaker.signal(False)
+    assert breaker.state == 'closed'
+
+def test_breakerProbe():
+    breaker = ratelimit.circuitBreaker(threshold = 1, window = 60, cooldown = 0.1, maxCooldown = 0.3)
+    breaker.signal(False)
+    time.sleep(0.15)
+
+    # Half open: one probe is let through, and everything else waits for it
+    assert breaker.allow() is True
+    assert breaker.state == 'halfOpen'
+    with pytest.raises(ratelimit.circuitOpen):
+        breaker.allow()
+
+    # A failed probe opens the breaker for twice as long, up to maxCooldown
+    assert breaker.signal(True)
+    assert (breaker.state, breaker.cooldown) == ('open', 0.2)
+    time.sleep(0.25)
+    assert breaker.allow() is True
+    breaker.signal(True)
+    assert breaker.cooldown == 0.3
+
+    # A probe failing for some other reason lets another request probe
+    time.sleep(0.35)
+    assert breaker.allow() is True
+    breaker.release(True)
+    assert breaker.allow() is True
+
+    # A successful probe closes the breaker
+    breaker.success(True)
+    assert (breaker.state, breaker.cooldown) == ('closed', 0.1)
+    assert breaker.allow() is False
+
+def request(governor, query, error = None):
+    try:
+        with governor.request(query):
+            if error:
+                raise error
+    except Exception as e:
+        return type(e)
+
+def test_governorSignals():
+    governor = ratelimit.governor(threshold = 2, cooldown = 60)
+
+    # Dates beyond SWA's published schedule aren't open either, so that's only a signal for queries
+    # which succeeded before
+    for day in range(5):
+        assert request(governor, {'departureDate': day}, swa.scrapeDatesNotOpen("")) is swa.scrapeDatesNotOpen
+    assert request(governor, {'departureDate': 0}, swa.scrapeValidation("")) is swa.scrapeValidation
+    assert governor.breaker.state == 'closed'
+
+    request(governor, {'departureDate': 0})
+    request(governor, {'departureDate': 0}, swa.scrapeDatesNotOpen(""))
+    request(governor, {'departureDate': 1}, swa.scrapeTimeout(""))
+    assert governor.breaker.state == 'open'
+    assert request(governor, {'departureDate': 2}) is ratelimit.circuitOpen
+
+def test_governorRate():
+    governor = ratelimit.governor(rate = 600, burst = 2, threshold = 1, cooldown = 0.05, minRate = 100)
+
+    request(governor, {'departureDate': 0}, swa.scrapeTimeout(""))
+    # Opening the breaker halves the rate, which creeps back up with every successful query
+    assert governor.bucket.rate == 300
+    time.sleep(0.1)
+    request(governor, {'departureDate': 0})
+    assert governor.bucket.rate == 306
+    assert governor.breaker.state == 'closed'
+
+def test_tokenBucket():
+    bucket = ratelimit.tokenBucket(rate = 1200, burst = 2)
+    assert bucket.acquire() < 0.01
+    assert bucket.acquire() < 0.01
+    # 1200 per minute is one every 50ms once the burst is used up
+    assert 0.02 < bucket.acquire() < 0.1
@@ -0,0 +1,23 @@
+import swa
+
+class scriptedDriver(object):
+    # Answers READY_SCRIPT with each of samples in turn, then keeps answering with the last one
+
+    def __init__(self, samples):
+        self.samples = list(samples)
+
+    def execute_script(self, script):
+        return self.samples.pop(0) if len(self.samples) > 1 else self.samples[0]
+
+def test_waitForStableResults():
+    samples = [[], [[0, '']], [[3, '$98|$129']], [[5, '$98|$129|$59']], [[5, '$98|$129|$59']]]
+    assert swa.waitForStableResults(scriptedDriver(samples), 1, timeout = 1, interval = 0.01)
+
+def test_waitForStableResultsRoundtrip():
+    # Both legs need rows
+    samples = [[[5, '$98'], [0, '']]]
+    assert not swa.waitForStableResults(scriptedDriver(samples), 2, timeout = 0.1, interval = 0.01)
+
+def test_waitForStableResultsEmpty():
+    # Matrices without rows may not have been filled in yet, so they're left to the reload
+    assert not swa.waitForStableResults(scriptedDriver([[[0, '']]]), 1, timeout = 0.1, interval = 0.01)